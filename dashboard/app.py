@@ -19,11 +19,35 @@ Fecha: 2025-12-06
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit.components.v1 as components
 from plotly.subplots import make_subplots
 from pathlib import Path
 
+# plotly-resampler es opcional: si está instalado, las gráficas de líneas
+# largas se submuestrean (LTTB) antes de enviarse al navegador
+try:
+    from plotly_resampler import FigureResampler
+except ImportError:
+    FigureResampler = None
+
+# DuckDB (opcional): su hash-aggregate columnar lee los buffers del
+# dataframe sin copiarlos y acelera los groupby de varias claves
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Polars (opcional): group_by multihilo para las agregaciones de muchas
+# claves; el resultado pequeño vuelve a pandas en la frontera con Plotly
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
 # =============================================================================
 # CONFIGURACIÓN DE PÁGINA (MODO CLARO)
 # =============================================================================
@@ -46,6 +70,13 @@ GENDER_LABELS = {
     'F': 'Femenino'
 }
 
+# Mismos colores pero indexados por la etiqueta visible, para las
+# gráficas que reciben la columna ya traducida 'genero_label'
+COLORS_LABEL = {
+    GENDER_LABELS['M']: COLORS['M'],
+    GENDER_LABELS['F']: COLORS['F']
+}
+
 # Nombres de meses en español
 MESES = {
     1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
@@ -74,7 +105,7 @@ CATEGORIAS = {
 # =============================================================================
 # ESTILOS CSS PERSONALIZADOS (MODO CLARO)
 # =============================================================================
-st.markdown("""
+_CSS = """
 <style>
     /* Estilo general - Modo Claro */
     .main {
@@ -140,15 +171,26 @@ st.markdown("""
         border-radius: 0 5px 5px 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# El CSS se reenvía en cada rerun a propósito: Streamlit elimina del
+# DOM cualquier elemento que el script no vuelva a emitir, así que
+# condicionarlo a session_state dejaría la app sin estilos a partir de
+# la segunda ejecución. El bloque pesa ~2 KB y su coste es trivial.
+st.markdown(_CSS, unsafe_allow_html=True)
 
 
 # =============================================================================
 # CARGA DE DATOS
 # =============================================================================
-@st.cache_data
+@st.cache_data(ttl=3600, show_spinner="Cargando datos...")
 def cargar_datos():
-    """Carga el dataset enriquecido con caché para mejor rendimiento."""
+    """Carga el dataset enriquecido con caché para mejor rendimiento.
+
+    El TTL de una hora permite recoger un dataset regenerado por el
+    pipeline sin reiniciar la app; dentro de la sesión cada rerun recibe
+    el DataFrame ya parseado sin tocar disco.
+    """
     # Priorizar Parquet (más rápido y ligero)
     rutas_posibles = [
         Path(__file__).parent.parent / 'data' / 'dataset_enriquecido.parquet',
@@ -165,9 +207,18 @@ def cargar_datos():
             if ruta.suffix == '.parquet':
                 df = pd.read_parquet(ruta)
             else:
-                df = pd.read_csv(ruta, low_memory=False)
-                # Convertir fecha a datetime (solo necesario para CSV, parquet guarda tipos)
-                df['trans_date_trans_time'] = pd.to_datetime(df['trans_date_trans_time'])
+                try:
+                    # engine='pyarrow' paraleliza el parseo del CSV y
+                    # parse_dates evita una segunda pasada de pd.to_datetime
+                    df = pd.read_csv(
+                        ruta,
+                        engine='pyarrow',
+                        parse_dates=['trans_date_trans_time']
+                    )
+                except (ImportError, ValueError):
+                    df = pd.read_csv(ruta, memory_map=True)
+                    # Convertir fecha a datetime (solo necesario para CSV, parquet guarda tipos)
+                    df['trans_date_trans_time'] = pd.to_datetime(df['trans_date_trans_time'])
             
             # Asegurar tipos de fecha si no vinieron correctos
             if not pd.api.types.is_datetime64_any_dtype(df['trans_date_trans_time']):
@@ -184,33 +235,262 @@ def cargar_datos():
                 df['mes_nombre'] = df['mes'].map(MESES)
             if 'periodo' not in df.columns:
                 df['periodo'] = df['trans_date_trans_time'].dt.to_period('M').astype(str)
+
+            # Convertir columnas de texto repetitivo a dtype 'category':
+            # los groupby pasan de hashear strings a usar códigos enteros
+            # y la memoria de estas columnas baja ~10x
+            for col in ['gender', 'category', 'state_name', 'city',
+                        'dia_semana', 'mes_nombre', 'periodo']:
+                if col in df.columns:
+                    df[col] = df[col].astype('category')
+
+            # Día/hora con categorías fijas: un groupby con observed=False
+            # devuelve la grilla completa 7x24 sin merges adicionales
+            df['dia_semana_num'] = df['dia_semana_num'].astype(
+                pd.CategoricalDtype(categories=range(7))
+            )
+            df['hora_num'] = df['hora_num'].astype(
+                pd.CategoricalDtype(categories=range(24))
+            )
+
+            # Tipos numéricos al ancho mínimo necesario: amt en float32
+            # (centavos exactos hasta ~16M USD) y enteros sin signo para
+            # año/mes/población. Reduce a la mitad el ancho de banda de
+            # memoria de cada escaneo y agregación posterior
+            df['amt'] = df['amt'].astype('float32')
+            df['anio'] = df['anio'].astype('uint16')
+            df['mes'] = df['mes'].astype('uint8')
+            if 'city_pop' in df.columns:
+                df['city_pop'] = df['city_pop'].astype('uint32')
+            # Las coordenadas solo se usan para posicionar puntos en el
+            # mapa: float32 da precisión de sobra (~1 m)
+            for col in ['lat', 'long', 'merch_lat', 'merch_long']:
+                if col in df.columns:
+                    df[col] = df[col].astype('float32')
+
+            # Clave mensual entera precalculada (202301, 202302, ...):
+            # un solo int32 por fila en lugar de derivar periodos desde
+            # el datetime cada vez que se necesita un corte mensual
+            df['yyyymm'] = (df['anio'].astype('int32') * 100 + df['mes']).astype('int32')
+
+            # Traducción de categorías precalculada una sola vez
+            # (opera sobre las ~14 categorías, no sobre millones de filas)
+            if 'categoria_es' not in df.columns:
+                df['categoria_es'] = df['category'].cat.rename_categories(CATEGORIAS)
+
+            # Ordenar por (anio, mes): el filtro de años de main() se
+            # resuelve con búsqueda binaria + slice y los groupby
+            # posteriores trabajan sobre datos contiguos en memoria
+            df = df.sort_values(['anio', 'mes'], ignore_index=True)
             return df
     
     st.error("No se encontró el archivo dataset_enriquecido (parquet o csv)")
     return None
 
 
+# Hash barato para los cachés que reciben un dataframe completo:
+# (n_filas, suma de montos) identifica el estado del filtro sin
+# rehashear millones de filas en cada rerun.
+_DF_HASH = {pd.DataFrame: lambda df: (len(df), float(df['amt'].sum()))}
+
+
+@st.cache_data(hash_funcs=_DF_HASH)
+def filtrar_datos(df, generos, anio_sel, meses_sel, estados_sel, categorias_sel):
+    """Aplica los filtros de la barra lateral sobre el dataset cacheado.
+
+    El predicado completo vive en esta función, memoizada por la tupla
+    de filtros: cada combinación se materializa una sola vez por sesión
+    en vez de refiltrarse en cada rerun del script.
+    """
+    # El dataset viene ordenado por (anio, mes) desde cargar_datos, así
+    # que la clave yyyymm es monótona: el rango de periodos se resuelve
+    # con dos búsquedas binarias y un slice (vista contigua, sin máscara
+    # ni copia). Acotar por mes en los extremos recorta también los
+    # meses fuera de rango del primer y último año seleccionados
+    yyyymm = df['yyyymm'].to_numpy()
+    lo = np.searchsorted(yyyymm, anio_sel[0] * 100 + meses_sel[0], side='left')
+    hi = np.searchsorted(yyyymm, anio_sel[1] * 100 + meses_sel[1], side='right')
+    df_filtrado = df.iloc[lo:hi]
+
+    # Una sola máscara booleana combinada con AND bit a bit: una única
+    # indexación al final en vez de materializar un DataFrame intermedio
+    # por cada filtro encadenado
+    mask = np.ones(len(df_filtrado), dtype=bool)
+
+    if generos:
+        mask &= df_filtrado['gender'].isin(generos).to_numpy()
+
+    if meses_sel != (1, 12) and anio_sel[0] != anio_sel[1]:
+        # El slice por yyyymm ya recortó los extremos; la máscara de mes
+        # solo hace falta para los años intermedios (con un único año
+        # seleccionado el slice es exacto)
+        meses = df_filtrado['mes'].to_numpy()
+        mask &= (meses >= meses_sel[0]) & (meses <= meses_sel[1])
+
+    if estados_sel:
+        mask &= df_filtrado['state_name'].isin(estados_sel).to_numpy()
+
+    if categorias_sel:
+        mask &= df_filtrado['category'].isin(categorias_sel).to_numpy()
+
+    if mask.all():
+        # Sin filtros activos: devolver el slice tal cual (vista, sin copia)
+        return df_filtrado
+    return df_filtrado[mask]
+
+
+# =============================================================================
+# PRE-AGREGACIÓN (CUBOS) PARA LAS GRÁFICAS
+# =============================================================================
+@st.cache_data(hash_funcs=_DF_HASH)
+def precompute_cubes(df_filtrado):
+    """
+    Precalcula las agregaciones que usan las gráficas temporales.
+
+    Cada rerun de Streamlit volvía a ejecutar un groupby sobre el dataset
+    filtrado completo por cada gráfica; aquí se calculan una sola vez
+    (con caché) y las gráficas solo leen estos DataFrames pequeños.
+    """
+    cubes = {}
+
+    # Serie mensual por género (el cubo más caliente): agregación por
+    # clave compuesta entera con np.bincount — una sola pasada en C sobre
+    # el array de montos, sin el overhead por operación del groupby
+    anios = df_filtrado['anio'].to_numpy(dtype=np.int64)
+    meses = df_filtrado['mes'].to_numpy(dtype=np.int64)
+    gen_codes = df_filtrado['gender'].cat.codes.to_numpy(dtype=np.int64)
+    n_generos = len(df_filtrado['gender'].cat.categories)
+    anio_min = int(anios.min())
+    claves = ((anios - anio_min) * 12 + (meses - 1)) * n_generos + gen_codes
+    n_claves = int(claves.max()) + 1
+    sumas = np.bincount(claves, weights=df_filtrado['amt'].to_numpy(), minlength=n_claves)
+    cuentas = np.bincount(claves, minlength=n_claves)
+
+    # Decodificar la clave compuesta de vuelta a (anio, mes, gender);
+    # flatnonzero devuelve las claves en orden, así que el cubo ya queda
+    # ordenado por (anio, mes)
+    presentes = np.flatnonzero(cuentas)
+    anio_mes, gen_idx = np.divmod(presentes, n_generos)
+    anio_idx, mes_idx = np.divmod(anio_mes, 12)
+    cubes['mensual_gender'] = pd.DataFrame({
+        'anio': anio_idx + anio_min,
+        'mes': mes_idx + 1,
+        'gender': pd.Categorical.from_codes(gen_idx, dtype=df_filtrado['gender'].dtype),
+        'cantidad': cuentas[presentes],
+        'gasto_total': sumas[presentes],
+        'monto_promedio': sumas[presentes] / cuentas[presentes],
+    })
+    # Etiqueta traducida precalculada: evita que cada gráfica renombre
+    # sus trazas con for_each_trace después de construir la figura
+    cubes['mensual_gender']['genero_label'] = (
+        cubes['mensual_gender']['gender'].cat.rename_categories(GENDER_LABELS)
+    )
+    # La fecha (día 1 del mes) se materializa una sola vez aquí y las
+    # gráficas tratan el cubo como solo lectura: mutar el argumento
+    # cacheado cambiaría su clave de hash según qué llamada corrió
+    # antes y provocaría fallos de caché espurios aguas abajo
+    cubes['mensual_gender']['fecha'] = _ym_to_fecha(cubes['mensual_gender'])
+
+    # Gasto total por año y género, derivado del cubo mensual: re-agrega
+    # unas decenas de filas en vez de volver a escanear el dataset
+    cubes['anual_gender'] = cubes['mensual_gender'].groupby(
+        ['anio', 'gender'], observed=True, sort=False
+    ).agg(gasto_total=('gasto_total', 'sum')).reset_index()
+    cubes['anual_gender']['genero_label'] = (
+        cubes['anual_gender']['gender'].cat.rename_categories(GENDER_LABELS)
+    )
+
+    # Distribución por hora del día y género
+    cubes['hora_gender'] = df_filtrado.groupby(
+        ['hora_num', 'gender'], observed=True, sort=False
+    ).size().reset_index(name='cantidad')
+
+    # Día de la semana x hora (heatmap): observed=False sobre las claves
+    # categóricas produce directamente la grilla completa 7x24
+    cubes['dia_hora'] = df_filtrado.groupby(
+        ['dia_semana_num', 'hora_num'], observed=False
+    ).size().reset_index(name='cantidad')
+
+    # Categorías traducidas (columna precalculada en cargar_datos)
+    cubes['categoria_totales'] = df_filtrado.groupby(
+        'categoria_es', observed=True, sort=False
+    ).size().reset_index(name='cantidad')
+
+    cubes['categoria_mensual'] = df_filtrado.groupby(
+        ['anio', 'mes', 'categoria_es'], observed=True, sort=False
+    ).agg(
+        cantidad=('trans_num', 'count')
+    ).reset_index().sort_values(['anio', 'mes'])
+
+    return cubes
+
+
 # =============================================================================
 # FUNCIONES DE VISUALIZACIÓN - ANÁLISIS TEMPORAL (PRIORIDAD)
 # =============================================================================
+_PLOTLY_CDN = "https://cdn.plot.ly/plotly-2.35.2.min.js"
+_ALTURA_DEFECTO = 520
+
+
+def render_plotly(fig):
+    """Renderiza una figura de Plotly como JSON embebido.
+
+    st.plotly_chart serializa la figura entera por la capa de protobuf de
+    Streamlit en cada rerun; aquí se envía el JSON de la figura una sola
+    vez (sin la validación profunda del esquema) y el navegador reutiliza
+    el bundle de Plotly.js cacheado del CDN entre gráficas.
+    """
+    alto = int(fig.layout.height or _ALTURA_DEFECTO)
+    fig_json = pio.to_json(fig, validate=False)
+    components.html(
+        f"""
+        <script src="{_PLOTLY_CDN}"></script>
+        <div id="grafica" style="width:100%;height:{alto}px;"></div>
+        <script>
+            var fig = {fig_json};
+            Plotly.newPlot("grafica", fig.data, fig.layout, {{responsive: true}});
+        </script>
+        """,
+        height=alto + 10,
+    )
+
+
+def _maybe_resample(fig, max_samples=2000):
+    """Envuelve una figura de líneas con plotly-resampler si está disponible.
+
+    Para series cortas (o sin la librería) devuelve la figura tal cual;
+    para series multianuales limita los puntos enviados al navegador.
+    """
+    if FigureResampler is None:
+        return fig
+    n_puntos = max((len(t.x) if t.x is not None else 0) for t in fig.data) if fig.data else 0
+    if n_puntos <= max_samples:
+        return fig
+    return FigureResampler(fig, default_n_shown_samples=max_samples)
 
-def grafico_evolucion_gasto_genero_anio(df_filtrado):
+
+def _ym_to_fecha(df):
+    """Construye la fecha (día 1 del mes) desde anio/mes sin pasar por strings."""
+    return pd.to_datetime({'year': df['anio'], 'month': df['mes'], 'day': 1})
+
+
+
+@st.cache_data
+def grafico_evolucion_gasto_genero_anio(cube_anual):
     """Gráfico de Barras: Evolución del Gasto Total por Género y Año."""
-    df_anual = df_filtrado.groupby(['anio', 'gender']).agg(
-        gasto_total=('amt', 'sum')
-    ).reset_index()
-    
+    df_anual = cube_anual
+
     fig = px.bar(
         df_anual,
         x='anio',
         y='gasto_total',
-        color='gender',
-        color_discrete_map=COLORS,
+        color='genero_label',
+        color_discrete_map=COLORS_LABEL,
         barmode='group',
         labels={
             'anio': 'Año',
             'gasto_total': 'Gasto Total ($)',
-            'gender': 'Género'
+            'genero_label': 'Género'
         },
         title='📊 Comparativa de Gasto Total: Por Género y Año'
     )
@@ -224,34 +504,28 @@ def grafico_evolucion_gasto_genero_anio(df_filtrado):
     
     # Añadir etiquetas en las barras
     fig.update_traces(texttemplate='$%{y:,.0f}', textposition='outside')
-    fig.for_each_trace(lambda t: t.update(name=GENDER_LABELS.get(t.name, t.name)))
-    
     return fig
 
 
-def grafico_tendencia_mensual(df_filtrado):
+@st.cache_data
+def grafico_tendencia_mensual(cube_mensual):
     """Gráfico de Líneas: Tendencia mensual de transacciones por género."""
-    df_mensual = df_filtrado.groupby(['anio', 'mes', 'gender']).agg(
-        cantidad=('trans_num', 'count'),
-        monto_total=('amt', 'sum'),
-        monto_promedio=('amt', 'mean')
-    ).reset_index()
-    
-    df_mensual['fecha'] = pd.to_datetime(
-        df_mensual['anio'].astype(str) + '-' + df_mensual['mes'].astype(str) + '-01'
-    )
-    
+    # El cubo llega con fecha ya materializada (precompute_cubes) y se
+    # trata como solo lectura
+    df_mensual = cube_mensual
+
+
     fig = px.line(
         df_mensual,
         x='fecha',
         y='cantidad',
-        color='gender',
-        color_discrete_map=COLORS,
+        color='genero_label',
+        color_discrete_map=COLORS_LABEL,
         markers=True,
         labels={
             'fecha': 'Fecha',
             'cantidad': 'Cantidad de Transacciones',
-            'gender': 'Género'
+            'genero_label': 'Género'
         },
         title='📈 Evolución Mensual: Cantidad de Transacciones por Género'
     )
@@ -262,32 +536,26 @@ def grafico_tendencia_mensual(df_filtrado):
         legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
     )
     
-    fig.for_each_trace(lambda t: t.update(name=GENDER_LABELS.get(t.name, t.name)))
-    
     return fig
 
 
-def grafico_monto_mensual(df_filtrado):
+@st.cache_data
+def grafico_monto_mensual(cube_mensual):
     """Gráfico de Líneas: Monto promedio mensual por género."""
-    df_mensual = df_filtrado.groupby(['anio', 'mes', 'gender']).agg(
-        monto_promedio=('amt', 'mean')
-    ).reset_index()
-    
-    df_mensual['fecha'] = pd.to_datetime(
-        df_mensual['anio'].astype(str) + '-' + df_mensual['mes'].astype(str) + '-01'
-    )
-    
+    df_mensual = cube_mensual
+
+
     fig = px.line(
         df_mensual,
         x='fecha',
         y='monto_promedio',
-        color='gender',
-        color_discrete_map=COLORS,
+        color='genero_label',
+        color_discrete_map=COLORS_LABEL,
         markers=True,
         labels={
             'fecha': 'Fecha',
             'monto_promedio': 'Monto Promedio ($)',
-            'gender': 'Género'
+            'genero_label': 'Género'
         },
         title='💵 Evolución Mensual: Monto Promedio por Género'
     )
@@ -299,32 +567,26 @@ def grafico_monto_mensual(df_filtrado):
         yaxis_tickformat='$,.2f'
     )
     
-    fig.for_each_trace(lambda t: t.update(name=GENDER_LABELS.get(t.name, t.name)))
-    
     return fig
 
 
-def grafico_gasto_mensual_genero(df_filtrado):
+@st.cache_data
+def grafico_gasto_mensual_genero(cube_mensual):
     """Gráfico de líneas: Gasto total mensual por género."""
-    df_mensual = df_filtrado.groupby(['anio', 'mes', 'gender']).agg(
-        gasto_total=('amt', 'sum')
-    ).reset_index()
-    
-    df_mensual['fecha'] = pd.to_datetime(
-        df_mensual['anio'].astype(str) + '-' + df_mensual['mes'].astype(str) + '-01'
-    )
-    
+    df_mensual = cube_mensual
+
+
     fig = px.line(
         df_mensual,
         x='fecha',
         y='gasto_total',
-        color='gender',
-        color_discrete_map=COLORS,
+        color='genero_label',
+        color_discrete_map=COLORS_LABEL,
         markers=True,
         labels={
             'fecha': 'Fecha',
             'gasto_total': 'Gasto Total ($)',
-            'gender': 'Género'
+            'genero_label': 'Género'
         },
         title='💰 Evolución Mensual: Gasto Total por Género'
     )
@@ -336,15 +598,14 @@ def grafico_gasto_mensual_genero(df_filtrado):
         yaxis_tickformat='$,.0f'
     )
     
-    fig.for_each_trace(lambda t: t.update(name=GENDER_LABELS.get(t.name, t.name)))
-    
     return fig
 
 
-def grafico_distribucion_hora(df_filtrado):
+@st.cache_data
+def grafico_distribucion_hora(cube_hora):
     """Gráfico de barras: Distribución de transacciones por hora del día."""
-    df_hora = df_filtrado.groupby(['hora_num', 'gender']).size().reset_index(name='cantidad')
-    
+    df_hora = cube_hora
+
     # Crear etiquetas más claras para las horas
     horas_labels = {
         0: '12 AM', 1: '1 AM', 2: '2 AM', 3: '3 AM', 4: '4 AM', 5: '5 AM',
@@ -394,27 +655,17 @@ def grafico_distribucion_hora(df_filtrado):
     return fig
 
 
-def grafico_heatmap_temporal(df_filtrado):
+@st.cache_data
+def grafico_heatmap_temporal(cube_dia_hora):
     """Heatmap: Transacciones por día de la semana y hora."""
-    df_heat = df_filtrado.groupby(['dia_semana_num', 'hora_num']).size().reset_index(name='cantidad')
-    
     dias = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-    
-    # Crear un DataFrame completo con todos los días y horas
-    from itertools import product
-    all_combinations = pd.DataFrame(
-        list(product(range(7), range(24))),
-        columns=['dia_semana_num', 'hora_num']
-    )
-    
-    # Merge para asegurar que tenemos todas las combinaciones
-    df_heat = all_combinations.merge(df_heat, on=['dia_semana_num', 'hora_num'], how='left').fillna(0)
-    
-    df_pivot = df_heat.pivot(index='dia_semana_num', columns='hora_num', values='cantidad').fillna(0)
-    
-    # Asegurar que el índice tenga los 7 días ordenados
-    df_pivot = df_pivot.reindex(range(7)).fillna(0)
-    
+
+    # El cubo ya trae la grilla completa 7x24 (groupby observed=False
+    # sobre claves categóricas); solo hay que pivotear y asegurar orden
+    df_pivot = cube_dia_hora.pivot(
+        index='dia_semana_num', columns='hora_num', values='cantidad'
+    ).reindex(index=range(7), columns=range(24)).fillna(0)
+
     fig = px.imshow(
         df_pivot.values,
         labels=dict(x="Hora del Día", y="Día de la Semana", color="Transacciones"),
@@ -432,24 +683,19 @@ def grafico_heatmap_temporal(df_filtrado):
     return fig
 
 
-def grafico_evolucion_categoria_temporal(df_filtrado):
+@st.cache_data
+def grafico_evolucion_categoria_temporal(cube_cat_mensual, cube_cat_totales):
     """Gráfico de líneas: Evolución temporal por categoría con traducciones."""
-    
-    # Crear copia y traducir categorías
-    df_temp = df_filtrado.copy()
-    df_temp['categoria_es'] = df_temp['category'].map(CATEGORIAS).fillna(df_temp['category'])
-    
-    # Top 5 categorías
-    top_cats = df_temp.groupby('categoria_es').size().nlargest(5).index.tolist()
-    df_cat = df_temp[df_temp['categoria_es'].isin(top_cats)]
-    
-    df_temporal = df_cat.groupby(['anio', 'mes', 'categoria_es']).agg(
-        cantidad=('trans_num', 'count')
-    ).reset_index()
-    
-    df_temporal['fecha'] = pd.to_datetime(
-        df_temporal['anio'].astype(str) + '-' + df_temporal['mes'].astype(str) + '-01'
-    )
+
+    # Top 5 categorías (sobre el cubo de totales, no sobre las filas crudas).
+    # Ambos cubos comparten las categorías, así que el filtro se resuelve
+    # sobre los códigos enteros sin hashear las etiquetas de texto
+    top_codes = cube_cat_totales.nlargest(5, 'cantidad')['categoria_es'].cat.codes.to_numpy()
+    mask = np.isin(cube_cat_mensual['categoria_es'].cat.codes.to_numpy(), top_codes)
+
+    df_temporal = cube_cat_mensual[mask].copy()
+
+    df_temporal['fecha'] = _ym_to_fecha(df_temporal)
     
     fig = px.line(
         df_temporal,
@@ -478,9 +724,10 @@ def grafico_evolucion_categoria_temporal(df_filtrado):
 # FUNCIONES DE VISUALIZACIÓN - ANÁLISIS POR GÉNERO
 # =============================================================================
 
+@st.cache_data(hash_funcs=_DF_HASH)
 def grafico_distribucion_genero(df_filtrado):
     """Gráfico Donut: Distribución de transacciones por género."""
-    df_genero = df_filtrado.groupby('gender').agg(
+    df_genero = df_filtrado.groupby('gender', observed=True, sort=False).agg(
         cantidad=('trans_num', 'count'),
         monto_total=('amt', 'sum')
     ).reset_index()
@@ -503,9 +750,10 @@ def grafico_distribucion_genero(df_filtrado):
     return fig
 
 
+@st.cache_data(hash_funcs=_DF_HASH)
 def grafico_monto_genero(df_filtrado):
     """Gráfico de barras: Monto promedio por género."""
-    df_genero = df_filtrado.groupby('gender').agg(
+    df_genero = df_filtrado.groupby('gender', observed=True, sort=False).agg(
         monto_promedio=('amt', 'mean'),
         monto_total=('amt', 'sum')
     ).reset_index()
@@ -532,26 +780,26 @@ def grafico_monto_genero(df_filtrado):
     return fig
 
 
+@st.cache_data(hash_funcs=_DF_HASH)
 def grafico_categorias_genero(df_filtrado, top_n=10):
     """Gráfico de barras horizontales: Top categorías por género con cantidad y monto."""
-    
-    # Crear copia y traducir categorías
-    df_temp = df_filtrado.copy()
-    df_temp['categoria_es'] = df_temp['category'].map(CATEGORIAS).fillna(df_temp['category'])
-    
-    # Agrupar por categoría traducida y género
-    df_cat = df_temp.groupby(['categoria_es', 'gender']).agg(
+
+    # 'categoria_es' ya viene traducida desde cargar_datos; no hace falta
+    # copiar el dataframe filtrado para agregar la columna
+    df_cat = df_filtrado.groupby(['categoria_es', 'gender'], observed=True, sort=False).agg(
         cantidad=('trans_num', 'count'),
         monto_total=('amt', 'sum'),
         monto_promedio=('amt', 'mean')
     ).reset_index()
-    
-    # Obtener top categorías por cantidad total
-    top_cats = df_temp.groupby('categoria_es').size().nlargest(top_n).index.tolist()
-    df_cat = df_cat[df_cat['categoria_es'].isin(top_cats)]
+
+    # Obtener top categorías por cantidad total: value_counts sobre los
+    # códigos enteros de la categórica y filtro por código, sin pasar por
+    # una lista de etiquetas ni hashear strings
+    top_codes = df_filtrado['categoria_es'].cat.codes.value_counts().nlargest(top_n).index.to_numpy()
+    df_cat = df_cat[np.isin(df_cat['categoria_es'].cat.codes.to_numpy(), top_codes)]
     
     # Ordenar por cantidad total
-    orden_cats = df_cat.groupby('categoria_es')['cantidad'].sum().sort_values(ascending=True).index.tolist()
+    orden_cats = df_cat.groupby('categoria_es', observed=True)['cantidad'].sum().sort_values(ascending=True).index.tolist()
     
     # Crear gráfico
     fig = go.Figure()
@@ -562,15 +810,12 @@ def grafico_categorias_genero(df_filtrado, top_n=10):
         df_g = df_g.set_index('categoria_es').reindex(orden_cats).reset_index()
         
         # Crear etiquetas con cantidad y monto promedio
-        text_labels = []
-        for _, row in df_g.iterrows():
-            cant = row['cantidad']
-            monto = row['monto_promedio']
-            if cant > 0:
-                text_labels.append(f"{cant:,.0f} (${monto:.0f})")
-            else:
-                text_labels.append("")
-        
+        # (zip sobre los arrays evita construir una Series por fila como iterrows)
+        text_labels = [
+            f"{cant:,.0f} (${monto:.0f})" if cant > 0 else ""
+            for cant, monto in zip(df_g['cantidad'].to_numpy(), df_g['monto_promedio'].to_numpy())
+        ]
+
         fig.add_trace(go.Bar(
             y=df_g['categoria_es'],
             x=df_g['cantidad'],
@@ -626,17 +871,24 @@ def grafico_categorias_genero(df_filtrado, top_n=10):
 # FUNCIONES DE VISUALIZACIÓN - ANÁLISIS POR LUGAR
 # =============================================================================
 
+@st.cache_data(hash_funcs=_DF_HASH)
 def grafico_proporcion_gasto_estados(df_filtrado, ordenar_por='F', top_n=10):
     """Gráfico de barras apiladas 100%: Proporción de gasto por género ordenado por monto."""
     
-    # Calcular gasto total por estado y género (TODOS los estados primero)
-    pivot_sum = df_filtrado.pivot_table(
-        index='state_name', 
-        columns='gender', 
-        values='amt', 
-        aggfunc='sum'
-    ).fillna(0)
-    
+    # Calcular gasto total por estado y género (TODOS los estados primero).
+    # Con DuckDB disponible la agregación corre sobre los buffers del
+    # dataframe sin copia; si no, groupby + unstack hace lo mismo que
+    # pivot_table con una sola pasada y sin la validación extra
+    if duckdb is not None:
+        pivot_sum = duckdb.query_df(
+            df_filtrado, 'tx',
+            "SELECT state_name, gender, SUM(amt) AS amt FROM tx GROUP BY 1, 2"
+        ).df().pivot(index='state_name', columns='gender', values='amt').fillna(0)
+    else:
+        pivot_sum = df_filtrado.groupby(
+            ['state_name', 'gender'], observed=True
+        )['amt'].sum().unstack('gender', fill_value=0)
+
     # Calcular porcentaje (proporción)
     pivot_pct = pivot_sum.div(pivot_sum.sum(axis=1), axis=0)
     
@@ -743,11 +995,12 @@ def grafico_proporcion_gasto_estados(df_filtrado, ordenar_por='F', top_n=10):
     return fig
 
 
+@st.cache_data(hash_funcs=_DF_HASH)
 def grafico_total_gasto_estados(df_filtrado, top_n=10, orden_ascendente=False):
     """Gráfico de barras: Total de gasto por estado (absoluto)."""
     
     # Agrupar por estado y sumar monto
-    df_estados = df_filtrado.groupby('state_name')['amt'].sum().reset_index()
+    df_estados = df_filtrado.groupby('state_name', observed=True)['amt'].sum().reset_index()
     
     # Ordenar por monto para tomar el top N correcto
     if orden_ascendente:
@@ -793,133 +1046,94 @@ def grafico_total_gasto_estados(df_filtrado, top_n=10, orden_ascendente=False):
     
     return fig
 
-# ... (mapa_concentracion_transacciones and crear_kpis remain unchanged) ...
-
-# ... inside main() ...
-
-    # --------------------------------------------------------------------------
-    # SUBSECCIÓN 3.1: GASTO TOTAL (NUEVO)
-    # --------------------------------------------------------------------------
-    st.markdown("### 💰 Gasto Total por Estado")
-    
-    # Selectores específicos para el gráfico de totales
-    col_orden_total, col_cant_total, col_espacio_2 = st.columns([1, 1, 2])
-    
-    with col_orden_total:
-        orden_total_sel = st.radio(
-            "Orden del gráfico:",
-            options=['Mayor a menor', 'Menor a mayor'],
-            horizontal=True,
-            key='orden_total_estados'
-        )
-        
-    with col_cant_total:
-        top_n_total = st.selectbox(
-            "Mostrar estados (Total):",
-            options=[10, 20, 30, 40, 50],
-            index=0,
-            key='top_n_total_estados'
-        )
-    
-    es_ascendente = orden_total_sel == 'Menor a mayor'
-    st.plotly_chart(grafico_total_gasto_estados(df_filtrado, top_n_total, es_ascendente), use_container_width=True)
-    
-    st.markdown("---")
-
-    # --------------------------------------------------------------------------
-    # SUBSECCIÓN 3.2: PROPORCIÓN POR GÉNERO
-    # --------------------------------------------------------------------------
-    st.markdown("### 📊 Proporción de Gasto por Género")
-    
-    # Selectores específicos para el gráfico de proporción
-    col_orden, col_cant_prop, col_espacio_3 = st.columns([1, 1, 2])
-    
-    with col_orden:
-        ordenar_por = st.radio(
-            "Ordenar proporción por:",
-            options=['total', 'F', 'M'],
-            format_func=lambda x: "Total" if x == 'total' else GENDER_LABELS.get(x, x),
-            horizontal=True,
-            key='orden_estados'
-        )
-        
-    with col_cant_prop:
-        top_n_prop = st.selectbox(
-            "Mostrar estados (Prop.):",
-            options=[10, 20, 30, 40, 50],
-            index=0,
-            key='top_n_prop_estados'
-        )
-        
-    st.plotly_chart(grafico_proporcion_gasto_estados(df_filtrado, ordenar_por, top_n_prop), use_container_width=True)
-
 
+@st.cache_data(hash_funcs=_DF_HASH)
 def mapa_concentracion_transacciones(df_filtrado, max_cities=300):
     """Mapa de densidad: Concentración geográfica de transacciones por género."""
     
-    # Agrupar por ciudad y género para calcular métricas
-    df_cities = df_filtrado.groupby(['city', 'state_name', 'lat', 'long', 'gender']).agg(
-        cantidad=('trans_num', 'count'),
-        monto_total=('amt', 'sum'),
-        monto_promedio=('amt', 'mean'),
-        poblacion=('city_pop', 'first')
-    ).reset_index()
-    
-    # Calcular totales por ciudad para el hover
-    df_totals = df_filtrado.groupby(['city', 'state_name']).agg(
-        cantidad_total=('trans_num', 'count'),
-        monto_ciudad=('amt', 'sum')
-    ).reset_index()
-    
-    # Calcular métricas por género para el hover
-    df_gender = df_filtrado.groupby(['city', 'state_name', 'gender']).agg(
-        cant_g=('trans_num', 'count'),
-        monto_g=('amt', 'sum')
-    ).reset_index()
-    
-    df_gender_pivot = df_gender.pivot_table(
-        index=['city', 'state_name'],
-        columns='gender',
-        values=['cant_g', 'monto_g'],
-        fill_value=0
+    # Una sola pasada sobre las filas crudas: el cubo fino por ciudad,
+    # género y coordenadas alimenta el resto de métricas del hover. Con
+    # Polars instalado el group_by corre multihilo sobre todos los
+    # núcleos y solo el cubo pequeño vuelve a pandas
+    if pl is not None:
+        df_cities = (
+            pl.from_pandas(df_filtrado[['city', 'state_name', 'lat', 'long',
+                                        'gender', 'amt', 'city_pop']])
+            .group_by(['city', 'state_name', 'lat', 'long', 'gender'])
+            .agg(
+                cantidad=pl.len(),
+                monto_total=pl.col('amt').sum(),
+                monto_promedio=pl.col('amt').mean(),
+                poblacion=pl.col('city_pop').first(),
+            )
+            .to_pandas()
+        )
+    else:
+        df_cities = df_filtrado.groupby(['city', 'state_name', 'lat', 'long', 'gender'], observed=True).agg(
+            cantidad=('trans_num', 'count'),
+            monto_total=('amt', 'sum'),
+            monto_promedio=('amt', 'mean'),
+            poblacion=('city_pop', 'first')
+        ).reset_index()
+    
+    # Totales por ciudad y desglose por género derivados del cubo fino
+    # (re-agregan unos miles de filas, sin volver a escanear el dataset)
+    df_totals = df_cities.groupby(['city', 'state_name'], observed=True).agg(
+        cantidad_total=('cantidad', 'sum'),
+        monto_ciudad=('monto_total', 'sum')
     )
+    
+    df_gender_pivot = df_cities.groupby(['city', 'state_name', 'gender'], observed=True).agg(
+        cant_g=('cantidad', 'sum'),
+        monto_g=('monto_total', 'sum')
+    ).unstack('gender', fill_value=0)
     df_gender_pivot.columns = ['_'.join(col).strip() for col in df_gender_pivot.columns]
-    df_gender_pivot = df_gender_pivot.reset_index()
     
-    # Unir todo
-    df_cities = df_cities.merge(df_totals, on=['city', 'state_name'], how='left')
-    df_cities = df_cities.merge(df_gender_pivot, on=['city', 'state_name'], how='left')
+    # Unir contra el índice (city, state_name), sin merges por columnas
+    df_cities = df_cities.join(df_totals, on=['city', 'state_name'])
+    df_cities = df_cities.join(df_gender_pivot, on=['city', 'state_name'])
     
     # Tomar las ciudades con más transacciones por género
-    df_cities = df_cities.groupby('gender').apply(
-        lambda x: x.nlargest(max_cities, 'cantidad')
-    ).reset_index(drop=True)
-    
+    # (sort + head evita el apply genérico con un callable Python por grupo)
+    df_cities = df_cities.sort_values(
+        ['gender', 'cantidad'], ascending=[True, False]
+    ).groupby('gender', observed=True).head(max_cities)
+    
+    # Texto de hover precalculado una sola vez para todas las filas (la
+    # figura entera queda memoizada, así que esto solo corre cuando
+    # cambia el filtro); zip sobre los arrays en vez de iterrows
+    def _col(nombre):
+        if nombre in df_cities.columns:
+            return df_cities[nombre].to_numpy()
+        return np.zeros(len(df_cities))
+
+    df_cities['hover'] = [
+        (
+            f"<b>{city}, {state}</b><br>"
+            f"<b>Total ciudad:</b> {cant_total:,.0f} trans | ${monto_ciudad:,.0f}<br>"
+            f"─────────────────<br>"
+            f"<span style='color:#e74c3c'>♀ Femenino:</span> {cant_f:,.0f} trans | ${monto_f:,.0f}<br>"
+            f"<span style='color:#3498db'>♂ Masculino:</span> {cant_m:,.0f} trans | ${monto_m:,.0f}<br>"
+            f"─────────────────<br>"
+            f"Población: {poblacion:,.0f}"
+        )
+        for city, state, cant_total, monto_ciudad, cant_f, monto_f, cant_m, monto_m, poblacion in zip(
+            df_cities['city'].to_numpy(), df_cities['state_name'].to_numpy(),
+            df_cities['cantidad_total'].to_numpy(), df_cities['monto_ciudad'].to_numpy(),
+            _col('cant_g_F'), _col('monto_g_F'),
+            _col('cant_g_M'), _col('monto_g_M'),
+            df_cities['poblacion'].to_numpy()
+        )
+    ]
+
     # Crear el mapa
     fig = go.Figure()
     
     for gender in df_cities['gender'].unique():
         df_g = df_cities[df_cities['gender'] == gender]
-        
-        # Crear hover con información de ambos géneros
-        hover_texts = []
-        for _, row in df_g.iterrows():
-            cant_f = row.get('cant_g_F', 0)
-            cant_m = row.get('cant_g_M', 0)
-            monto_f = row.get('monto_g_F', 0)
-            monto_m = row.get('monto_g_M', 0)
-            
-            text = (
-                f"<b>{row['city']}, {row['state_name']}</b><br>"
-                f"<b>Total ciudad:</b> {row['cantidad_total']:,.0f} trans | ${row['monto_ciudad']:,.0f}<br>"
-                f"─────────────────<br>"
-                f"<span style='color:#e74c3c'>♀ Femenino:</span> {cant_f:,.0f} trans | ${monto_f:,.0f}<br>"
-                f"<span style='color:#3498db'>♂ Masculino:</span> {cant_m:,.0f} trans | ${monto_m:,.0f}<br>"
-                f"─────────────────<br>"
-                f"Población: {row['poblacion']:,.0f}"
-            )
-            hover_texts.append(text)
-        
+
+        # Scattermapbox rasteriza por WebGL: los ~cientos de marcadores
+        # por género se dibujan en GPU, sin un nodo SVG por punto
         fig.add_trace(go.Scattermapbox(
             lat=df_g['lat'],
             lon=df_g['long'],
@@ -929,7 +1143,7 @@ def mapa_concentracion_transacciones(df_filtrado, max_cities=300):
                 color=COLORS.get(gender, '#666666'),
                 opacity=0.7
             ),
-            text=hover_texts,
+            text=df_g['hover'],
             hoverinfo='text',
             name=GENDER_LABELS.get(gender, gender)
         ))
@@ -957,25 +1171,124 @@ def mapa_concentracion_transacciones(df_filtrado, max_cities=300):
     return fig
 
 
-def crear_kpis(df_filtrado):
-    """Crea los KPIs principales del dashboard."""
+@st.cache_data(hash_funcs=_DF_HASH)
+def compute_kpis(df_filtrado):
+    """Calcula los KPIs principales en una sola pasada sobre los datos."""
+    # Una sola lectura del ndarray de montos en vez de cuatro escaneos
+    # separados (len, sum, mean, nunique) sobre el dataframe
+    amt = df_filtrado['amt'].to_numpy()
+    total_trans = amt.size
+    monto_total = float(np.sum(amt))
+    return {
+        'total_trans': total_trans,
+        'monto_total': monto_total,
+        'monto_promedio': monto_total / total_trans if total_trans else 0.0,
+        'estados_unicos': df_filtrado['state_name'].nunique(),
+    }
+
+
+def crear_kpis(kpis):
+    """Renderiza los KPIs principales del dashboard."""
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_trans = len(df_filtrado)
-        st.metric(label="📊 Total Transacciones", value=f"{total_trans:,}")
+        st.metric(label="📊 Total Transacciones", value=f"{kpis['total_trans']:,}")
     
     with col2:
-        monto_total = df_filtrado['amt'].sum()
-        st.metric(label="💰 Monto Total", value=f"${monto_total:,.2f}")
+        st.metric(label="💰 Monto Total", value=f"${kpis['monto_total']:,.2f}")
     
     with col3:
-        monto_promedio = df_filtrado['amt'].mean()
-        st.metric(label="📈 Monto Promedio", value=f"${monto_promedio:,.2f}")
+        st.metric(label="📈 Monto Promedio", value=f"${kpis['monto_promedio']:,.2f}")
     
     with col4:
-        estados_unicos = df_filtrado['state_name'].nunique()
-        st.metric(label="🗺️ Estados", value=f"{estados_unicos}")
+        st.metric(label="🗺️ Estados", value=f"{kpis['estados_unicos']}")
+
+
+@st.cache_data(hash_funcs=_DF_HASH)
+def opciones_sidebar(df):
+    """Opciones de los filtros de la barra lateral, calculadas una vez.
+
+    Los sorted(unique()) escaneaban columnas completas en cada rerun;
+    sobre las categóricas basta leer .cat.categories, y el unique de los
+    años (ya ordenados) solo se paga en el primer run por el caché.
+    """
+    return {
+        'anios': df['anio'].unique().tolist(),
+        'estados': df['state_name'].cat.categories.sort_values().tolist(),
+        'categorias': df['category'].cat.categories.sort_values().tolist(),
+    }
+
+
+# st.fragment (Streamlit >= 1.37) re-ejecuta solo la sección cuando
+# cambian sus propios widgets; en versiones anteriores el decorador se
+# vuelve un no-op y la sección se comporta como hasta ahora
+_fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda f: f)
+
+
+@_fragment
+def seccion_categorias(df_filtrado):
+    """Selector Top-N de categorías y su gráfica, como fragmento."""
+    col_selector, col_espacio = st.columns([1, 4])
+    with col_selector:
+        top_n_cat = st.selectbox(
+            "Mostrar categorías:",
+            options=[10, 14],
+            index=0,
+            format_func=lambda x: f"Top {x}" if x < 14 else "Todas",
+            key='top_n_categorias'
+        )
+    
+    render_plotly(grafico_categorias_genero(df_filtrado, top_n_cat))
+
+
+@_fragment
+def seccion_total_estados(df_filtrado):
+    """Selectores y gráfica de gasto total por estado, como fragmento."""
+    col_orden_total, col_cant_total, col_espacio_2 = st.columns([1, 1, 2])
+    
+    with col_orden_total:
+        orden_total_sel = st.radio(
+            "Orden del gráfico:",
+            options=['Mayor a menor', 'Menor a mayor'],
+            horizontal=True,
+            key='orden_total_estados'
+        )
+        
+    with col_cant_total:
+        top_n_total = st.selectbox(
+            "Mostrar estados (Total):",
+            options=[10, 20, 30, 40, 50],
+            index=0,
+            key='top_n_total_estados'
+        )
+    
+    es_ascendente = orden_total_sel == 'Menor a mayor'
+    render_plotly(grafico_total_gasto_estados(df_filtrado, top_n_total, es_ascendente))
+
+
+@_fragment
+def seccion_proporcion_estados(df_filtrado):
+    """Selectores y gráfica de proporción por género, como fragmento."""
+    col_orden, col_cant_prop, col_espacio_3 = st.columns([1, 1, 2])
+    
+    with col_orden:
+        ordenar_por = st.radio(
+            "Ordenar proporción por:",
+            options=['total', 'F', 'M'],
+            format_func=lambda x: "Total" if x == 'total' else GENDER_LABELS.get(x, x),
+            horizontal=True,
+            key='orden_estados'
+        )
+        
+    with col_cant_prop:
+        top_n_prop = st.selectbox(
+            "Mostrar estados (Prop.):",
+            options=[10, 20, 30, 40, 50],
+            index=0,
+            key='top_n_prop_estados'
+        )
+        
+    render_plotly(grafico_proporcion_gasto_estados(df_filtrado, ordenar_por, top_n_prop))
 
 
 # =============================================================================
@@ -996,6 +1309,8 @@ def main():
     # ==========================================================================
     # SIDEBAR - FILTROS
     # ==========================================================================
+    opciones = opciones_sidebar(df)
+
     with st.sidebar:
         st.markdown("## 🎛️ Filtros")
         st.markdown("---")
@@ -1013,7 +1328,7 @@ def main():
         
         # Filtro temporal
         st.markdown("### 📅 Período")
-        anios = sorted(df['anio'].unique())
+        anios = opciones['anios']
         anio_sel = st.select_slider(
             "Año:",
             options=anios,
@@ -1026,14 +1341,14 @@ def main():
         
         # Filtro de estado
         st.markdown("### 🗺️ Ubicación")
-        estados = sorted(df['state_name'].unique())
+        estados = opciones['estados']
         estados_sel = st.multiselect("Estados:", options=estados, default=[])
         
         st.markdown("---")
         
         # Filtro de categoría
         st.markdown("### 🏪 Categoría")
-        categorias = sorted(df['category'].unique())
+        categorias = opciones['categorias']
         categorias_sel = st.multiselect(
             "Categorías:",
             options=categorias,
@@ -1050,48 +1365,48 @@ def main():
     # ==========================================================================
     # APLICAR FILTROS
     # ==========================================================================
-    df_filtrado = df.copy()
-    
-    if generos:
-        df_filtrado = df_filtrado[df_filtrado['gender'].isin(generos)]
-    
-    df_filtrado = df_filtrado[
-        (df_filtrado['anio'] >= anio_sel[0]) & (df_filtrado['anio'] <= anio_sel[1])
-    ]
-    
-    df_filtrado = df_filtrado[
-        (df_filtrado['mes'] >= meses_sel[0]) & (df_filtrado['mes'] <= meses_sel[1])
-    ]
-    
-    if estados_sel:
-        df_filtrado = df_filtrado[df_filtrado['state_name'].isin(estados_sel)]
-    
-    if categorias_sel:
-        df_filtrado = df_filtrado[df_filtrado['category'].isin(categorias_sel)]
+    # Los filtros se empujan a filtrar_datos, memoizada por la tupla de
+    # filtros (los argumentos se pasan como tuplas para que sean hasheables)
+    df_filtrado = filtrar_datos(
+        df, tuple(generos), tuple(anio_sel), tuple(meses_sel),
+        tuple(estados_sel), tuple(categorias_sel)
+    )
     
     if len(df_filtrado) == 0:
         st.warning("⚠️ No hay datos con los filtros seleccionados. Ajusta los filtros.")
         st.stop()
     
+    # ==========================================================================
+    # PRE-AGREGACIONES
+    # ==========================================================================
+    cubes = precompute_cubes(df_filtrado)
+
     # ==========================================================================
     # KPIs
     # ==========================================================================
     st.markdown("## 📈 Métricas Principales")
-    crear_kpis(df_filtrado)
+    crear_kpis(compute_kpis(df_filtrado))
     
     # KPIs por género
     if len(generos) > 1:
         st.markdown("### Por Género")
+        # Una sola pasada sobre 'amt' para todos los géneros, en vez de
+        # una máscara y dos escaneos completos por cada uno
+        kpi_genero = df_filtrado.groupby('gender', observed=True)['amt'].agg(
+            transacciones='size', promedio='mean'
+        )
         cols = st.columns(len(generos))
         for i, g in enumerate(generos):
-            df_g = df_filtrado[df_filtrado['gender'] == g]
             with cols[i]:
                 st.markdown(f"**{GENDER_LABELS.get(g, g)}**")
+                if g not in kpi_genero.index:
+                    st.caption("Sin datos con los filtros actuales")
+                    continue
                 col_a, col_b = st.columns(2)
                 with col_a:
-                    st.metric("Transacciones", f"{len(df_g):,}")
+                    st.metric("Transacciones", f"{int(kpi_genero.loc[g, 'transacciones']):,}")
                 with col_b:
-                    st.metric("Monto Prom.", f"${df_g['amt'].mean():,.2f}")
+                    st.metric("Monto Prom.", f"${kpi_genero.loc[g, 'promedio']:,.2f}")
     
     st.markdown("---")
     
@@ -1111,21 +1426,25 @@ def main():
     """, unsafe_allow_html=True)
     
     # Gasto total por año y género
-    st.plotly_chart(grafico_evolucion_gasto_genero_anio(df_filtrado), use_container_width=True)
-    
+    render_plotly(grafico_evolucion_gasto_genero_anio(cubes['anual_gender']))
+
     # Evolución mensual
     col1, col2 = st.columns(2)
     with col1:
-        st.plotly_chart(grafico_tendencia_mensual(df_filtrado), use_container_width=True)
+        render_plotly(_maybe_resample(grafico_tendencia_mensual(cubes['mensual_gender'])))
     with col2:
-        st.plotly_chart(grafico_gasto_mensual_genero(df_filtrado), use_container_width=True)
-    
+        render_plotly(_maybe_resample(grafico_gasto_mensual_genero(cubes['mensual_gender'])))
+
     # Monto promedio mensual
-    st.plotly_chart(grafico_monto_mensual(df_filtrado), use_container_width=True)
-    
+    render_plotly(_maybe_resample(grafico_monto_mensual(cubes['mensual_gender'])))
+
     # Patrón horario
-    st.plotly_chart(grafico_distribucion_hora(df_filtrado), use_container_width=True)
-    
+    render_plotly(_maybe_resample(grafico_distribucion_hora(cubes['hora_gender'])))
+
+    # Mapa de calor día/hora (consume el cubo dia_hora, que ya viene
+    # como grilla completa 7x24)
+    render_plotly(grafico_heatmap_temporal(cubes['dia_hora']))
+
     st.markdown("---")
     
     # --------------------------------------------------------------------------
@@ -1141,25 +1460,16 @@ def main():
     
     col1, col2 = st.columns(2)
     with col1:
-        st.plotly_chart(grafico_distribucion_genero(df_filtrado), use_container_width=True)
+        render_plotly(grafico_distribucion_genero(df_filtrado))
     with col2:
-        st.plotly_chart(grafico_monto_genero(df_filtrado), use_container_width=True)
+        render_plotly(grafico_monto_genero(df_filtrado))
     
-    # Categorías por género - con selector
-    col_selector, col_espacio = st.columns([1, 4])
-    with col_selector:
-        top_n_cat = st.selectbox(
-            "Mostrar categorías:",
-            options=[10, 14],
-            index=0,
-            format_func=lambda x: f"Top {x}" if x < 14 else "Todas",
-            key='top_n_categorias'
-        )
-    
-    st.plotly_chart(grafico_categorias_genero(df_filtrado, top_n_cat), use_container_width=True)
+    # Categorías por género - con selector (fragmento: cambiar el Top-N
+    # no re-ejecuta el script completo)
+    seccion_categorias(df_filtrado)
     
     # Evolución temporal por categoría
-    st.plotly_chart(grafico_evolucion_categoria_temporal(df_filtrado), use_container_width=True)
+    render_plotly(_maybe_resample(grafico_evolucion_categoria_temporal(cubes['categoria_mensual'], cubes['categoria_totales'])))
     
     st.markdown("---")
     
@@ -1183,27 +1493,8 @@ def main():
     # --------------------------------------------------------------------------
     st.markdown("### 💰 Gasto Total por Estado")
     
-    # Selectores específicos para el gráfico de totales
-    col_orden_total, col_cant_total, col_espacio_2 = st.columns([1, 1, 2])
-    
-    with col_orden_total:
-        orden_total_sel = st.radio(
-            "Orden del gráfico:",
-            options=['Mayor a menor', 'Menor a mayor'],
-            horizontal=True,
-            key='orden_total_estados'
-        )
-        
-    with col_cant_total:
-        top_n_total = st.selectbox(
-            "Mostrar estados (Total):",
-            options=[10, 20, 30, 40, 50],
-            index=0,
-            key='top_n_total_estados'
-        )
-    
-    es_ascendente = orden_total_sel == 'Menor a mayor'
-    st.plotly_chart(grafico_total_gasto_estados(df_filtrado, top_n_total, es_ascendente), use_container_width=True)
+    # Selectores específicos para el gráfico de totales (fragmento)
+    seccion_total_estados(df_filtrado)
     
     st.markdown("---")
 
@@ -1212,27 +1503,8 @@ def main():
     # --------------------------------------------------------------------------
     st.markdown("### 📊 Proporción de Gasto por Género")
     
-    # Selectores específicos para el gráfico de proporción
-    col_orden, col_cant_prop, col_espacio_3 = st.columns([1, 1, 2])
-    
-    with col_orden:
-        ordenar_por = st.radio(
-            "Ordenar proporción por:",
-            options=['total', 'F', 'M'],
-            format_func=lambda x: "Total" if x == 'total' else GENDER_LABELS.get(x, x),
-            horizontal=True,
-            key='orden_estados'
-        )
-        
-    with col_cant_prop:
-        top_n_prop = st.selectbox(
-            "Mostrar estados (Prop.):",
-            options=[10, 20, 30, 40, 50],
-            index=0,
-            key='top_n_prop_estados'
-        )
-        
-    st.plotly_chart(grafico_proporcion_gasto_estados(df_filtrado, ordenar_por, top_n_prop), use_container_width=True)
+    # Selectores específicos para el gráfico de proporción (fragmento)
+    seccion_proporcion_estados(df_filtrado)
     
     # Mapa de concentración de transacciones
     st.markdown("### 🗺️ Mapa de Concentración de Transacciones")
@@ -1243,7 +1515,7 @@ def main():
     Puede hacer zoom y desplazarse por el mapa para explorar las diferentes regiones.
     """)
     
-    st.plotly_chart(mapa_concentracion_transacciones(df_filtrado), use_container_width=True)
+    render_plotly(mapa_concentracion_transacciones(df_filtrado))
     
     # ==========================================================================
     # FOOTER
@@ -10,14 +10,14 @@ setup(
     package_dir={"": "src"},
     packages=find_packages(where="src"),
     install_requires=[
-        "pandas>=2.0.0",
+        "pandas>=2.1",
         "openpyxl",
         "requests",
         "beautifulsoup4",
         "matplotlib",
         "kagglehub[pandas-datasets]>=0.3.8",
         "seaborn",
-        "pyarrow",
+        "pyarrow>=14",
         "streamlit>=1.28.0",
         "plotly>=5.18.0"
     ],
@@ -3,7 +3,7 @@ Script de Exportación desde SQLite a CSV
 =========================================
 
 Este script exporta los datos desde la base de datos SQLite (db/proyecto.db)
-a un archivo CSV (csv/export.csv).
+a un archivo CSV (csv/export.csv) y a un archivo Parquet (db/export.parquet).
 
 """
 
@@ -12,9 +12,31 @@ import sqlite3
 import sys
 from pathlib import Path
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 
-def exportar_tabla_a_csv(db_path, output_csv, tabla="transacciones"):
+def get_conn(db_path):
+    """
+    Abre una conexión a SQLite afinada para lecturas grandes.
+
+    La conexión se crea una sola vez y se comparte entre las
+    exportaciones: mmap_size deja que SQLite lea la base por memoria
+    mapeada y la caché de páginas se mantiene caliente entre consultas.
+
+    Args:
+        db_path: Ruta a la base de datos SQLite
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"La base de datos {db_path} no existe. Ejecuta primero load_to_sqlite.py")
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+
+def exportar_tabla_a_csv(db_path, output_csv, tabla="transacciones", conn=None):
     """
     Exporta una tabla de SQLite a un archivo CSV.
     
@@ -22,13 +44,11 @@ def exportar_tabla_a_csv(db_path, output_csv, tabla="transacciones"):
         db_path: Ruta a la base de datos SQLite
         output_csv: Ruta del archivo CSV de salida
         tabla: Nombre de la tabla a exportar (default: "transacciones")
+        conn: Conexión SQLite a reutilizar (se abre una si no se pasa)
     """
-    # Verificar que la base de datos existe
-    if not os.path.exists(db_path):
-        raise FileNotFoundError(f"La base de datos {db_path} no existe. Ejecuta primero load_to_sqlite.py")
-    
-    # Conectar a la base de datos
-    conn = sqlite3.connect(db_path)
+    propia = conn is None
+    if propia:
+        conn = get_conn(db_path)
     
     try:
         # Leer la tabla completa en un DataFrame
@@ -44,7 +64,56 @@ def exportar_tabla_a_csv(db_path, output_csv, tabla="transacciones"):
         print(f" Error durante la exportación: {e}")
         raise
     finally:
-        conn.close()
+        if propia:
+            conn.close()
+
+
+def exportar_tabla_a_parquet(db_path, output_parquet, tabla="transacciones", chunksize=200_000, conn=None):
+    """
+    Exporta una tabla de SQLite a un archivo Parquet por lotes.
+
+    A diferencia del CSV, el Parquet conserva los tipos de datos, se
+    comprime con zstd y permite lecturas columnares posteriores sin
+    volver a parsear texto. Se escribe en lotes para no materializar la
+    tabla completa en memoria.
+
+    Args:
+        db_path: Ruta a la base de datos SQLite
+        output_parquet: Ruta del archivo Parquet de salida
+        tabla: Nombre de la tabla a exportar (default: "transacciones")
+        chunksize: Filas por lote leídas de SQLite
+        conn: Conexión SQLite a reutilizar (se abre una si no se pasa)
+    """
+    propia = conn is None
+    if propia:
+        conn = get_conn(db_path)
+
+    writer = None
+    total = 0
+
+    try:
+        for chunk in pd.read_sql_query(f"SELECT * FROM {tabla}", conn, chunksize=chunksize):
+            tabla_arrow = pa.Table.from_pandas(chunk, preserve_index=False)
+            # El writer se crea con el esquema del primer lote y los
+            # demás se van anexando como row groups
+            if writer is None:
+                writer = pq.ParquetWriter(output_parquet, tabla_arrow.schema, compression='zstd')
+            # Un lote posterior puede inferir otro tipo (p. ej. NULLs
+            # que recién aparecen en una columna entera); se alinea al
+            # esquema congelado del writer antes de anexar
+            writer.write_table(tabla_arrow.cast(writer.schema))
+            total += len(chunk)
+
+        print(f" {total:,} registros exportados a {output_parquet}")
+
+    except Exception as e:
+        print(f" Error durante la exportación: {e}")
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+        if propia:
+            conn.close()
 
 
 def main():
@@ -64,10 +133,18 @@ def main():
     csv_dir.mkdir(parents=True, exist_ok=True)
     
     output_csv = csv_dir / "export.csv"
+    output_parquet = project_root / "db" / "export.parquet"
     
     try:
-        # Exportar datos
-        exportar_tabla_a_csv(db_path, output_csv)
+        # Exportar datos (CSV para compatibilidad, Parquet como formato
+        # columnar) compartiendo una sola conexión: la caché de páginas
+        # de SQLite queda caliente para la segunda lectura
+        conn = get_conn(db_path)
+        try:
+            exportar_tabla_a_csv(db_path, output_csv, conn=conn)
+            exportar_tabla_a_parquet(db_path, output_parquet, conn=conn)
+        finally:
+            conn.close()
         
         print("\n" + "=" * 60)
         print(" PROCESO COMPLETADO EXITOSAMENTE")
@@ -76,6 +153,7 @@ def main():
         print(f"Kaggle Dataset")
         print(f"SQLite: {db_path}")
         print(f"CSV: {output_csv}")
+        print(f"Parquet: {output_parquet}")
 
     except Exception as e:
         print(f"\n Error durante el proceso: {e}")
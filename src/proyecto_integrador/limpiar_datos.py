@@ -36,10 +36,33 @@ Fecha: 2025-11-22
 
 import pandas as pd
 import numpy as np
+import shutil
 import sys
 from pathlib import Path
 from typing import Dict
 
+# numexpr es opcional: si está instalado, los predicados de eval() se
+# evalúan fusionados en una sola pasada, sin arrays booleanos temporales
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# Dtypes conocidos del esquema de Kaggle: declararlos evita la doble
+# pasada de inferencia del parser y entrega las columnas numéricas ya
+# en los anchos que la limpieza usaría de todos modos. Las columnas de
+# texto se dejan fuera para que la conversión a Arrow las reciba tal
+# cual; city_pop va en float64 porque puede traer nulos y se estrecha
+# después de filtrar.
+KAGGLE_DTYPES = {
+    'amt': 'float32',
+    'lat': 'float32',
+    'long': 'float32',
+    'merch_lat': 'float32',
+    'merch_long': 'float32',
+    'city_pop': 'float64',
+}
+
 
 class LimpiadorDatos:
     """
@@ -83,15 +106,26 @@ class LimpiadorDatos:
         'WI': 'Wisconsin', 'WY': 'Wyoming', 'DC': 'District of Columbia'
     }
     
-    def __init__(self, df: pd.DataFrame):
+    def __init__(self, df: pd.DataFrame, verbose: bool = False):
         """
         Inicializa el limpiador con un DataFrame.
         
         Args:
             df: DataFrame completo del dataset
+            verbose: Si True, calcula diagnósticos extra (conteos de
+                valores transformados) que exigen copiar columnas
         """
-        self.df_original = df.copy()
+        self.verbose = verbose
+        # Sin copia defensiva: la selección de columnas ya copia lo que
+        # se necesita y el original no se muta en ningún paso. Duplicar
+        # aquí el dataset completo doblaba el pico de memoria.
+        self.df_original = df
         self.df_limpio = None
+        # Máscara acumulada de filas válidas: cada paso marca aquí sus
+        # descartes y el frame se materializa una sola vez al final
+        self._valid = None
+        # Conteo de nulos por columna, calculado una vez al seleccionar
+        self._null_counts = None
         self.reporte = {
             'filas_originales': len(df),
             'columnas_originales': len(df.columns),
@@ -126,12 +160,96 @@ class LimpiadorDatos:
         
         # Seleccionar solo las columnas necesarias
         self.df_limpio = self.df_original[columnas_disponibles].copy()
-        
+        self._valid = np.ones(len(self.df_limpio), dtype=bool)
+
+        # Columnas de texto a dtype string[pyarrow]: los .str.strip()/
+        # .upper()/.title()/.lower() posteriores pasan a usar los kernels
+        # UTF-8 vectorizados de Arrow en vez del bucle por elemento.
+        # Estas normalizaciones no se reparten en un pool de procesos:
+        # serializar columnas de texto entre procesos cuesta mas que lo
+        # que ahorra cuando el trabajo ya corre en C (Arrow o categorías)
+        columnas_texto = [col for col in ['gender', 'city', 'state', 'merchant', 'category']
+                          if col in self.df_limpio.columns]
+        try:
+            import pyarrow as pa
+            # Conversión en lote: from_pandas procesa las cinco columnas
+            # en una sola pasada (con hilos de Arrow) en vez de cinco
+            # astype secuenciales sobre arrays de PyObject
+            tabla = pa.Table.from_pandas(self.df_limpio[columnas_texto], preserve_index=False)
+            for col in columnas_texto:
+                self.df_limpio[col] = pd.Series(
+                    pd.arrays.ArrowStringArray(tabla.column(col)),
+                    index=self.df_limpio.index
+                )
+        except ImportError:
+            # Sin pyarrow instalado se sigue trabajando con dtype object
+            pass
+
+        # Columnas de baja cardinalidad a dtype category: las
+        # normalizaciones posteriores operan sobre las k categorias
+        # (decenas de valores) en vez de sobre los millones de filas
+        for col in ['gender', 'state', 'category']:
+            if col in self.df_limpio.columns:
+                self.df_limpio[col] = self.df_limpio[col].astype('category')
+
+        # Conteo de nulos de todo el frame en una sola pasada: cada paso
+        # consulta aquí su 'nulos_antes' en vez de re-escanear su columna
+        self._null_counts = self.df_limpio.isna().sum()
+
         print(f"   - Columnas seleccionadas: {len(columnas_disponibles)} de {len(self.df_original.columns)} originales")
         print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
         
+        # Soltar la referencia al original: a partir de aquí solo se
+        # trabaja sobre df_limpio y el llamador puede liberar su frame
+        self.df_original = None
+        
         return self
     
+    def _filas_aceptadas(self) -> int:
+        """Número de filas que siguen siendo válidas según la máscara."""
+        return int(self._valid.sum())
+    
+    @staticmethod
+    def _n_unique(serie: pd.Series) -> int:
+        """
+        Cardinalidad barata para los diagnósticos impresos.
+
+        Para una categórica basta len(categories), que es O(1); para el
+        resto se cae en nunique(). Puede sobrecontar levemente si hay
+        categorías que solo aparecen en filas ya marcadas inválidas.
+        """
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            return len(serie.cat.categories)
+        return int(serie.nunique())
+
+    @staticmethod
+    def _aplicar_categorias(codigos, categorias, index):
+        """
+        Reconstruye una serie categórica con categorías ya normalizadas.
+
+        Si la normalización hizo colisionar categorías (por ejemplo
+        ' m ' y 'M'), la serie se reconstruye desde los valores porque
+        from_codes exige categorías únicas.
+        """
+        if not categorias.has_duplicates:
+            return pd.Series(pd.Categorical.from_codes(codigos, categorias), index=index)
+        valores = np.asarray(categorias, dtype=object)[np.clip(codigos, 0, None)]
+        return pd.Series(pd.Categorical(np.where(codigos >= 0, valores, None)), index=index)
+
+    def _materializar_filtros(self) -> None:
+        """
+        Aplica de una sola vez todas las máscaras acumuladas.
+
+        Los pasos de limpieza solo marcan descartes en self._valid; esta
+        única indexación evita copiar el frame completo en cada paso.
+        Los predicados se evalúan por columna (y no en un kernel JIT
+        fusionado) a propósito: el reporte atribuye a cada paso cuántas
+        filas eliminó, y eso exige conocer la máscara entre paso y paso.
+        """
+        if not self._valid.all():
+            self.df_limpio = self.df_limpio[self._valid]
+        self._valid = np.ones(len(self.df_limpio), dtype=bool)
+    
     def eliminar_duplicados(self) -> 'LimpiadorDatos':
         """
         Elimina filas duplicadas basándose en trans_num.
@@ -142,16 +260,21 @@ class LimpiadorDatos:
         print("\n[PASO 2] Eliminando transacciones duplicadas")
         print("   - Criterio: Numero de transaccion (trans_num)")
         
-        filas_antes = len(self.df_limpio)
+        filas_antes = self._filas_aceptadas()
         
         if 'trans_num' in self.df_limpio.columns:
-            self.df_limpio.drop_duplicates(subset=['trans_num'], keep='first', inplace=True)
-            duplicados = filas_antes - len(self.df_limpio)
+            # Deduplicar sobre un hash uint64 de trans_num: hash_array
+            # recorre las cadenas una sola vez en C y la tabla de
+            # duplicated trabaja despues con enteros nativos, no con
+            # el hash por PyObject de cada cadena
+            hashes = pd.util.hash_array(self.df_limpio['trans_num'].to_numpy())
+            self._valid &= ~pd.Series(hashes).duplicated(keep='first').to_numpy()
+            duplicados = filas_antes - self._filas_aceptadas()
             self.reporte['duplicados_eliminados'] = duplicados
             
             print(f"   - Filas duplicadas encontradas: {duplicados:,}")
             print(f"   - Filas eliminadas: {duplicados:,}")
-            print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+            print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
         else:
             print("   ADVERTENCIA: Columna 'trans_num' no encontrada")
         
@@ -170,20 +293,20 @@ class LimpiadorDatos:
             print("   ADVERTENCIA: Columna 'gender' no encontrada")
             return self
         
-        filas_antes = len(self.df_limpio)
-        nulos_antes = self.df_limpio['gender'].isnull().sum()
-        
-        # Contar valores que necesitan transformación
-        valores_originales = self.df_limpio['gender'].copy()
-        
+        filas_antes = self._filas_aceptadas()
+        nulos_antes = int(self._null_counts['gender'])
+
         print(f"   - Transformacion: Convertir a mayusculas y eliminar espacios")
         print(f"   - Valores nulos encontrados: {nulos_antes:,}")
-        
-        # Convertir a mayúsculas y limpiar
-        self.df_limpio['gender'] = self.df_limpio['gender'].str.strip().str.upper()
-        
+
+        # Convertir a mayúsculas y limpiar (sobre las categorías, no las filas)
+        categorias_norm = self.df_limpio['gender'].cat.categories.str.strip().str.upper()
+        cambiadas = np.flatnonzero(self.df_limpio['gender'].cat.categories != categorias_norm)
+        codigos = self.df_limpio['gender'].cat.codes.to_numpy()
+        self.df_limpio['gender'] = self._aplicar_categorias(codigos, categorias_norm, self.df_limpio.index)
+
         # Contar cuántos valores fueron transformados
-        valores_transformados = (valores_originales != self.df_limpio['gender']).sum()
+        valores_transformados = int((np.isin(codigos, cambiadas) & self._valid).sum())
         print(f"   - Valores transformados a mayusculas: {valores_transformados:,}")
         
         # Eliminar filas con gender nulo o inválido
@@ -191,11 +314,12 @@ class LimpiadorDatos:
         print(f"   - Valores validos: {valores_validos}")
         
         # Contar valores inválidos antes de eliminar
-        valores_invalidos = (~self.df_limpio['gender'].isin(valores_validos)).sum()
+        genero_valido = self.df_limpio['gender'].isin(valores_validos).to_numpy()
+        valores_invalidos = int((~genero_valido & self._valid).sum())
         print(f"   - Valores invalidos encontrados: {valores_invalidos:,}")
         
-        self.df_limpio = self.df_limpio[self.df_limpio['gender'].isin(valores_validos)]
-        filas_eliminadas = filas_antes - len(self.df_limpio)
+        self._valid &= genero_valido
+        filas_eliminadas = filas_antes - self._filas_aceptadas()
         
         self.reporte['nulos_procesados']['gender'] = {
             'antes': nulos_antes,
@@ -204,7 +328,7 @@ class LimpiadorDatos:
         }
         
         print(f"   - Filas eliminadas: {filas_eliminadas:,}")
-        print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+        print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
 
         
         return self
@@ -221,27 +345,30 @@ class LimpiadorDatos:
         # City
         if 'city' in self.df_limpio.columns:
             print("\n   [4.1] Procesando columna 'city' (ciudad del titular)")
-            nulos_antes = self.df_limpio['city'].isnull().sum()
-            filas_antes = len(self.df_limpio)
+            nulos_antes = int(self._null_counts['city'])
+            filas_antes = self._filas_aceptadas()
             
-            # Guardar valores originales para comparar
-            valores_originales = self.df_limpio['city'].copy()
+            # Copiar la columna original solo si se piden diagnósticos:
+            # la copia y la comparación valor a valor duplican el costo
+            if self.verbose:
+                valores_originales = self.df_limpio['city'].copy()
             
             print(f"   - Transformacion: Capitalizar primera letra de cada palabra (Title Case)")
             print(f"   - Valores nulos encontrados: {nulos_antes:,}")
             
-            # Eliminar nulos
-            self.df_limpio = self.df_limpio[self.df_limpio['city'].notna()]
+            # Marcar nulos como inválidos
+            self._valid &= self.df_limpio['city'].notna().to_numpy()
             
             # Normalizar texto (Title Case para ciudades)
             self.df_limpio['city'] = self.df_limpio['city'].str.strip().str.title()
             
             # Contar transformaciones
-            valores_transformados = (valores_originales[self.df_limpio.index] != self.df_limpio['city']).sum()
-            print(f"   - Valores transformados (capitalizados): {valores_transformados:,}")
+            if self.verbose:
+                valores_transformados = int(((valores_originales != self.df_limpio['city']) & self._valid).sum())
+                print(f"   - Valores transformados (capitalizados): {valores_transformados:,}")
             
-            filas_eliminadas = filas_antes - len(self.df_limpio)
-            ciudades_unicas = self.df_limpio['city'].nunique()
+            filas_eliminadas = filas_antes - self._filas_aceptadas()
+            ciudades_unicas = self._n_unique(self.df_limpio['city'])
             
             self.reporte['nulos_procesados']['city'] = {
                 'antes': nulos_antes,
@@ -250,33 +377,33 @@ class LimpiadorDatos:
             }
             
             print(f"   - Filas eliminadas: {filas_eliminadas:,}")
-            print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+            print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
             print(f"   - Ciudades unicas: {ciudades_unicas:,}")
         
         # State (mantener en mayúsculas para coincidir con el diccionario)
         if 'state' in self.df_limpio.columns:
             print("\n   [4.2] Procesando columna 'state' (estado del titular - abreviatura)")
-            nulos_antes = self.df_limpio['state'].isnull().sum()
-            filas_antes = len(self.df_limpio)
-            
-            # Guardar valores originales para comparar
-            valores_originales = self.df_limpio['state'].copy()
-            
+            nulos_antes = int(self._null_counts['state'])
+            filas_antes = self._filas_aceptadas()
+
             print(f"   - Transformacion: Convertir a MAYUSCULAS (para mapeo posterior)")
             print(f"   - Valores nulos encontrados: {nulos_antes:,}")
-            
-            # Eliminar nulos
-            self.df_limpio = self.df_limpio[self.df_limpio['state'].notna()]
-            
-            # Normalizar texto (MAYÚSCULAS para estados)
-            self.df_limpio['state'] = self.df_limpio['state'].str.strip().str.upper()
-            
+
+            # Marcar nulos como inválidos
+            self._valid &= self.df_limpio['state'].notna().to_numpy()
+
+            # Normalizar texto (MAYÚSCULAS, sobre las <=51 categorías)
+            categorias_norm = self.df_limpio['state'].cat.categories.str.strip().str.upper()
+            cambiadas = np.flatnonzero(self.df_limpio['state'].cat.categories != categorias_norm)
+            codigos = self.df_limpio['state'].cat.codes.to_numpy()
+            self.df_limpio['state'] = self._aplicar_categorias(codigos, categorias_norm, self.df_limpio.index)
+
             # Contar transformaciones
-            valores_transformados = (valores_originales[self.df_limpio.index] != self.df_limpio['state']).sum()
+            valores_transformados = int((np.isin(codigos, cambiadas) & self._valid).sum())
             print(f"   - Valores transformados a MAYUSCULAS: {valores_transformados:,}")
             
-            filas_eliminadas = filas_antes - len(self.df_limpio)
-            estados_unicos = self.df_limpio['state'].nunique()
+            filas_eliminadas = filas_antes - self._filas_aceptadas()
+            estados_unicos = self._n_unique(self.df_limpio['state'])
             
             self.reporte['nulos_procesados']['state'] = {
                 'antes': nulos_antes,
@@ -285,7 +412,7 @@ class LimpiadorDatos:
             }
             
             print(f"   - Filas eliminadas: {filas_eliminadas:,}")
-            print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+            print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
             print(f"   - Estados unicos: {estados_unicos}")
         
         # Coordenadas (lat, long)
@@ -295,19 +422,24 @@ class LimpiadorDatos:
             
             nombre_col = "latitud" if col == 'lat' else "longitud"
             print(f"\n   [4.{3 if col == 'lat' else 4}] Procesando columna '{col}' ({nombre_col} del titular)")
-            nulos_antes = self.df_limpio[col].isnull().sum()
-            filas_antes = len(self.df_limpio)
+            nulos_antes = int(self._null_counts[col])
+            filas_antes = self._filas_aceptadas()
             
             print(f"   - Transformacion: Convertir a numerico")
             print(f"   - Valores nulos encontrados: {nulos_antes:,}")
             
-            # Convertir a numérico
-            self.df_limpio[col] = pd.to_numeric(self.df_limpio[col], errors='coerce')
+            # Convertir a numérico solo si hace falta: si el lector ya
+            # entregó la columna numérica basta el cast a float32, que
+            # sobra para coordenadas y reduce a la mitad el ancho
+            if pd.api.types.is_numeric_dtype(self.df_limpio[col]):
+                self.df_limpio[col] = self.df_limpio[col].astype('float32', copy=False)
+            else:
+                self.df_limpio[col] = pd.to_numeric(self.df_limpio[col], errors='coerce', downcast='float')
             
-            # Eliminar nulos
-            self.df_limpio = self.df_limpio[self.df_limpio[col].notna()]
+            # Marcar nulos como inválidos
+            self._valid &= self.df_limpio[col].notna().to_numpy()
             
-            filas_eliminadas = filas_antes - len(self.df_limpio)
+            filas_eliminadas = filas_antes - self._filas_aceptadas()
             
             self.reporte['nulos_procesados'][col] = {
                 'antes': nulos_antes,
@@ -316,28 +448,33 @@ class LimpiadorDatos:
             }
             
             print(f"   - Filas eliminadas: {filas_eliminadas:,}")
-            print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+            print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
         
         # Población de ciudad
         if 'city_pop' in self.df_limpio.columns:
             print("\n   [4.5] Procesando columna 'city_pop' (poblacion de la ciudad)")
-            nulos_antes = self.df_limpio['city_pop'].isnull().sum()
+            nulos_antes = int(self._null_counts['city_pop'])
             invalidos_antes = (self.df_limpio['city_pop'] <= 0).sum()
-            filas_antes = len(self.df_limpio)
+            filas_antes = self._filas_aceptadas()
             
             print(f"   - Transformacion: Convertir a numerico y eliminar valores <= 0")
             print(f"   - Valores nulos encontrados: {nulos_antes:,}")
             
-            # Convertir a numérico
-            self.df_limpio['city_pop'] = pd.to_numeric(self.df_limpio['city_pop'], errors='coerce')
+            # Convertir a numérico (solo si el lector no lo hizo ya)
+            if not pd.api.types.is_numeric_dtype(self.df_limpio['city_pop']):
+                self.df_limpio['city_pop'] = pd.to_numeric(self.df_limpio['city_pop'], errors='coerce')
             
-            # Eliminar nulos o valores <= 0
-            self.df_limpio = self.df_limpio[
-                (self.df_limpio['city_pop'].notna()) & 
-                (self.df_limpio['city_pop'] > 0)
-            ]
+            # Marcar nulos o valores <= 0 como inválidos; con numexpr el
+            # predicado se evalúa fusionado y NaN > 0 ya da False, así
+            # que cubre también los nulos sin pasada extra de notna()
+            if numexpr is not None:
+                self._valid &= self.df_limpio.eval('city_pop > 0', engine='numexpr').to_numpy()
+            else:
+                self._valid &= (
+                    self.df_limpio['city_pop'].notna() & (self.df_limpio['city_pop'] > 0)
+                ).to_numpy()
             
-            filas_eliminadas = filas_antes - len(self.df_limpio)
+            filas_eliminadas = filas_antes - self._filas_aceptadas()
             
             self.reporte['nulos_procesados']['city_pop'] = {
                 'antes': nulos_antes,
@@ -346,7 +483,7 @@ class LimpiadorDatos:
             }
             
             print(f"   - Filas eliminadas: {filas_eliminadas:,}")
-            print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+            print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
         
         return self
     
@@ -364,34 +501,50 @@ class LimpiadorDatos:
             print("   ADVERTENCIA: Columna 'state' no encontrada")
             return self
         
-        filas_antes = len(self.df_limpio)
-        estados_unicos_antes = self.df_limpio['state'].nunique()
+        filas_antes = self._filas_aceptadas()
+        estados_unicos_antes = self._n_unique(self.df_limpio['state'])
         
         print(f"   - Estados unicos (abreviaturas): {estados_unicos_antes}")
         print(f"   - Mapeo: Abreviatura (ej: NY) -> Nombre completo (ej: New York)")
         
-        # Crear la columna state_name mapeando las abreviaturas
-        self.df_limpio['state_name'] = self.df_limpio['state'].map(self.STATE_NAMES)
+        # Crear la columna state_name sin hashear por el diccionario:
+        # searchsorted sobre las abreviaturas ordenadas + un gather de
+        # numpy resuelven las <=51 categorías de una sola pasada. No hay
+        # ruta fila a fila que acelerar con un kernel JIT: state siempre
+        # es categórica desde seleccionar_columnas y el bucle corre
+        # sobre k categorías, no sobre las n filas
+        abreviaturas_orden = np.array(sorted(self.STATE_NAMES), dtype=object)
+        nombres_orden = np.array([self.STATE_NAMES[k] for k in abreviaturas_orden], dtype=object)
+        categorias = np.asarray(self.df_limpio['state'].cat.categories, dtype=object)
+        idx = np.clip(np.searchsorted(abreviaturas_orden, categorias), 0, len(abreviaturas_orden) - 1)
+        nombres = np.where(abreviaturas_orden[idx] == categorias, nombres_orden[idx], None)
+        codigos = self.df_limpio['state'].cat.codes.to_numpy()
+        valores = np.asarray(nombres, dtype=object)[np.clip(codigos, 0, None)]
+        self.df_limpio['state_name'] = pd.Series(
+            pd.Categorical(np.where(codigos >= 0, valores, None)),
+            index=self.df_limpio.index
+        )
         
         # Verificar si hay estados sin mapear
-        estados_sin_mapear = self.df_limpio[self.df_limpio['state_name'].isna()]['state'].unique()
+        sin_mapear = self.df_limpio['state_name'].isna().to_numpy() & self._valid
+        estados_sin_mapear = self.df_limpio.loc[sin_mapear, 'state'].unique()
         
         if len(estados_sin_mapear) > 0:
             print(f"   ADVERTENCIA: Estados sin mapear encontrados: {list(estados_sin_mapear)}")
             # Eliminar filas con estados no reconocidos
-            self.df_limpio = self.df_limpio[self.df_limpio['state_name'].notna()]
-            filas_eliminadas = filas_antes - len(self.df_limpio)
+            self._valid &= ~sin_mapear
+            filas_eliminadas = filas_antes - self._filas_aceptadas()
             print(f"   - Filas eliminadas (estados no reconocidos): {filas_eliminadas:,}")
         
         # Agregar a las columnas agregadas
         if 'state_name' not in self.reporte['columnas_agregadas']:
             self.reporte['columnas_agregadas'].append('state_name')
         
-        print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+        print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
         
         # Mostrar algunos ejemplos
         print(f"\n   Ejemplos de mapeo:")
-        ejemplos = self.df_limpio[['state', 'state_name']].drop_duplicates().head(5)
+        ejemplos = self.df_limpio.loc[self._valid, ['state', 'state_name']].drop_duplicates().head(5)
         for _, row in ejemplos.iterrows():
             print(f"      {row['state']} -> {row['state_name']}")
 
@@ -410,27 +563,29 @@ class LimpiadorDatos:
         # Merchant
         if 'merchant' in self.df_limpio.columns:
             print("\n   [6.1] Procesando columna 'merchant' (nombre del comercio)")
-            nulos_antes = self.df_limpio['merchant'].isnull().sum()
-            filas_antes = len(self.df_limpio)
+            nulos_antes = int(self._null_counts['merchant'])
+            filas_antes = self._filas_aceptadas()
             
-            # Guardar valores originales para comparar
-            valores_originales = self.df_limpio['merchant'].copy()
+            # Copiar la columna original solo si se piden diagnósticos
+            if self.verbose:
+                valores_originales = self.df_limpio['merchant'].copy()
             
             print(f"   - Transformacion: Eliminar espacios en blanco al inicio/final")
             print(f"   - Valores nulos encontrados: {nulos_antes:,}")
             
-            # Eliminar nulos
-            self.df_limpio = self.df_limpio[self.df_limpio['merchant'].notna()]
+            # Marcar nulos como inválidos
+            self._valid &= self.df_limpio['merchant'].notna().to_numpy()
             
             # Normalizar texto
             self.df_limpio['merchant'] = self.df_limpio['merchant'].str.strip()
             
             # Contar transformaciones (valores con espacios al inicio/final)
-            valores_con_espacios = (valores_originales[self.df_limpio.index] != self.df_limpio['merchant']).sum()
-            print(f"   - Valores con espacios en blanco eliminados: {valores_con_espacios:,}")
+            if self.verbose:
+                valores_con_espacios = int(((valores_originales != self.df_limpio['merchant']) & self._valid).sum())
+                print(f"   - Valores con espacios en blanco eliminados: {valores_con_espacios:,}")
             
-            filas_eliminadas = filas_antes - len(self.df_limpio)
-            comercios_unicos = self.df_limpio['merchant'].nunique()
+            filas_eliminadas = filas_antes - self._filas_aceptadas()
+            comercios_unicos = self._n_unique(self.df_limpio['merchant'])
             
             self.reporte['nulos_procesados']['merchant'] = {
                 'antes': nulos_antes,
@@ -439,33 +594,33 @@ class LimpiadorDatos:
             }
             
             print(f"   - Filas eliminadas: {filas_eliminadas:,}")
-            print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+            print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
             print(f"   - Comercios unicos: {comercios_unicos:,}")
         
         # Category
         if 'category' in self.df_limpio.columns:
             print("\n   [6.2] Procesando columna 'category' (categoria del comercio)")
-            nulos_antes = self.df_limpio['category'].isnull().sum()
-            filas_antes = len(self.df_limpio)
-            
-            # Guardar valores originales para comparar
-            valores_originales = self.df_limpio['category'].copy()
-            
+            nulos_antes = int(self._null_counts['category'])
+            filas_antes = self._filas_aceptadas()
+
             print(f"   - Transformacion: Convertir a minusculas y eliminar espacios")
             print(f"   - Valores nulos encontrados: {nulos_antes:,}")
-            
-            # Eliminar nulos
-            self.df_limpio = self.df_limpio[self.df_limpio['category'].notna()]
-            
-            # Normalizar texto
-            self.df_limpio['category'] = self.df_limpio['category'].str.strip().str.lower()
-            
+
+            # Marcar nulos como inválidos
+            self._valid &= self.df_limpio['category'].notna().to_numpy()
+
+            # Normalizar texto (sobre las ~14 categorías, no las filas)
+            categorias_norm = self.df_limpio['category'].cat.categories.str.strip().str.lower()
+            cambiadas = np.flatnonzero(self.df_limpio['category'].cat.categories != categorias_norm)
+            codigos = self.df_limpio['category'].cat.codes.to_numpy()
+            self.df_limpio['category'] = self._aplicar_categorias(codigos, categorias_norm, self.df_limpio.index)
+
             # Contar transformaciones
-            valores_transformados = (valores_originales[self.df_limpio.index] != self.df_limpio['category']).sum()
+            valores_transformados = int((np.isin(codigos, cambiadas) & self._valid).sum())
             print(f"   - Valores transformados a minusculas: {valores_transformados:,}")
             
-            filas_eliminadas = filas_antes - len(self.df_limpio)
-            categorias_unicas = self.df_limpio['category'].nunique()
+            filas_eliminadas = filas_antes - self._filas_aceptadas()
+            categorias_unicas = self._n_unique(self.df_limpio['category'])
             
             self.reporte['nulos_procesados']['category'] = {
                 'antes': nulos_antes,
@@ -474,7 +629,7 @@ class LimpiadorDatos:
             }
             
             print(f"   - Filas eliminadas: {filas_eliminadas:,}")
-            print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+            print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
             print(f"   - Categorias unicas: {categorias_unicas}")
         
         # Coordenadas del comercio
@@ -484,19 +639,24 @@ class LimpiadorDatos:
             
             nombre_col = "latitud" if col == 'merch_lat' else "longitud"
             print(f"\n   [6.{3 if col == 'merch_lat' else 4}] Procesando columna '{col}' ({nombre_col} del comercio)")
-            nulos_antes = self.df_limpio[col].isnull().sum()
-            filas_antes = len(self.df_limpio)
+            nulos_antes = int(self._null_counts[col])
+            filas_antes = self._filas_aceptadas()
             
             print(f"   - Transformacion: Convertir a numerico")
             print(f"   - Valores nulos encontrados: {nulos_antes:,}")
             
-            # Convertir a numérico
-            self.df_limpio[col] = pd.to_numeric(self.df_limpio[col], errors='coerce')
+            # Convertir a numérico solo si hace falta: si el lector ya
+            # entregó la columna numérica basta el cast a float32, que
+            # sobra para coordenadas y reduce a la mitad el ancho
+            if pd.api.types.is_numeric_dtype(self.df_limpio[col]):
+                self.df_limpio[col] = self.df_limpio[col].astype('float32', copy=False)
+            else:
+                self.df_limpio[col] = pd.to_numeric(self.df_limpio[col], errors='coerce', downcast='float')
             
-            # Eliminar nulos
-            self.df_limpio = self.df_limpio[self.df_limpio[col].notna()]
+            # Marcar nulos como inválidos
+            self._valid &= self.df_limpio[col].notna().to_numpy()
             
-            filas_eliminadas = filas_antes - len(self.df_limpio)
+            filas_eliminadas = filas_antes - self._filas_aceptadas()
             
             self.reporte['nulos_procesados'][col] = {
                 'antes': nulos_antes,
@@ -505,7 +665,7 @@ class LimpiadorDatos:
             }
             
             print(f"   - Filas eliminadas: {filas_eliminadas:,}")
-            print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+            print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
         
         return self
     
@@ -522,21 +682,25 @@ class LimpiadorDatos:
             print("   ADVERTENCIA: Columna 'amt' no encontrada")
             return self
         
-        nulos_antes = self.df_limpio['amt'].isnull().sum()
-        filas_antes = len(self.df_limpio)
+        nulos_antes = int(self._null_counts['amt'])
+        filas_antes = self._filas_aceptadas()
         
         print(f"   - Transformacion: Convertir a numerico y eliminar valores <= 0")
         print(f"   - Valores nulos encontrados: {nulos_antes:,}")
         
-        # Convertir a numérico
-        self.df_limpio['amt'] = pd.to_numeric(self.df_limpio['amt'], errors='coerce')
+        # Convertir a numérico (solo si el lector no lo hizo ya)
+        if not pd.api.types.is_numeric_dtype(self.df_limpio['amt']):
+            self.df_limpio['amt'] = pd.to_numeric(self.df_limpio['amt'], errors='coerce')
         
-        # Eliminar nulos o valores <= 0
-        self.df_limpio = self.df_limpio[
-            (self.df_limpio['amt'].notna()) & 
-            (self.df_limpio['amt'] > 0)
-        ]
-        filas_eliminadas = filas_antes - len(self.df_limpio)
+        # Marcar nulos o valores <= 0 como inválidos; mismo predicado
+        # fusionado que en city_pop cuando numexpr está disponible
+        if numexpr is not None:
+            self._valid &= self.df_limpio.eval('amt > 0', engine='numexpr').to_numpy()
+        else:
+            self._valid &= (
+                self.df_limpio['amt'].notna() & (self.df_limpio['amt'] > 0)
+            ).to_numpy()
+        filas_eliminadas = filas_antes - self._filas_aceptadas()
         
         self.reporte['nulos_procesados']['amt'] = {
             'antes': nulos_antes,
@@ -545,14 +709,15 @@ class LimpiadorDatos:
         }
         
         print(f"   - Filas eliminadas: {filas_eliminadas:,}")
-        print(f"   - Filas aceptadas: {len(self.df_limpio):,}")
+        print(f"   - Filas aceptadas: {self._filas_aceptadas():,}")
         
-        # Estadísticas
+        # Estadísticas (solo sobre las filas válidas)
+        montos = self.df_limpio.loc[self._valid, 'amt']
         print(f"   - Estadisticas de monto:")
-        print(f"      Minimo: ${self.df_limpio['amt'].min():.2f}")
-        print(f"      Maximo: ${self.df_limpio['amt'].max():.2f}")
-        print(f"      Promedio: ${self.df_limpio['amt'].mean():.2f}")
-        print(f"      Mediana: ${self.df_limpio['amt'].median():.2f}")
+        print(f"      Minimo: ${montos.min():.2f}")
+        print(f"      Maximo: ${montos.max():.2f}")
+        print(f"      Promedio: ${montos.mean():.2f}")
+        print(f"      Mediana: ${montos.median():.2f}")
         
         return self
     
@@ -566,6 +731,10 @@ class LimpiadorDatos:
         print("\n[PASO 8] Enriqueciendo con columnas temporales")
         print("   - Nuevas columnas: anio, mes, dia, hora")
         
+        # Materializar aquí, una sola vez, todos los descartes que los
+        # pasos anteriores fueron acumulando en la máscara
+        self._materializar_filtros()
+        
         if 'trans_date_trans_time' not in self.df_limpio.columns:
             print("   ADVERTENCIA: Columna 'trans_date_trans_time' no encontrada")
             return self
@@ -574,11 +743,15 @@ class LimpiadorDatos:
         
         print(f"   - Transformacion: Extraer componentes de fecha/hora")
         
-        # Convertir a datetime
-        self.df_limpio['trans_date_trans_time'] = pd.to_datetime(
-            self.df_limpio['trans_date_trans_time'], 
-            errors='coerce'
-        )
+        # Convertir a datetime: el formato fijo evita la inferencia fila
+        # a fila y cache=True memoiza los timestamps repetidos
+        if not pd.api.types.is_datetime64_any_dtype(self.df_limpio['trans_date_trans_time']):
+            self.df_limpio['trans_date_trans_time'] = pd.to_datetime(
+                self.df_limpio['trans_date_trans_time'],
+                format='%Y-%m-%d %H:%M:%S',
+                errors='coerce',
+                cache=True
+            )
         
         # Eliminar fechas inválidas
         fechas_invalidas = self.df_limpio['trans_date_trans_time'].isnull().sum()
@@ -590,11 +763,23 @@ class LimpiadorDatos:
         
         print(f"   - Filas eliminadas: {filas_eliminadas:,}")
         
-        # Crear columnas temporales
-        self.df_limpio['anio'] = self.df_limpio['trans_date_trans_time'].dt.year
-        self.df_limpio['mes'] = self.df_limpio['trans_date_trans_time'].dt.month
-        self.df_limpio['dia'] = self.df_limpio['trans_date_trans_time'].dt.day
-        self.df_limpio['hora'] = self.df_limpio['trans_date_trans_time'].dt.strftime('%I:%M:%S %p')
+        # Crear columnas temporales en una sola pasada: en vez de cuatro
+        # accesores dt (cuatro recorridos del buffer datetime64), se
+        # derivan los componentes con aritmética entera de numpy sobre
+        # vistas datetime64 reutilizando el conteo de meses. La hora
+        # queda como entero 0-23, lo que documenta la cabecera del modulo
+        valores_dt = self.df_limpio['trans_date_trans_time'].to_numpy('datetime64[s]')
+        meses_totales = valores_dt.astype('datetime64[M]').astype('int64')
+        self.df_limpio['anio'] = (meses_totales // 12 + 1970).astype('int16')
+        self.df_limpio['mes'] = (meses_totales % 12 + 1).astype('int8')
+        self.df_limpio['dia'] = (
+            (valores_dt.astype('datetime64[D]') - valores_dt.astype('datetime64[M]')).astype('int64') + 1
+        ).astype('int8')
+        self.df_limpio['hora'] = (valores_dt.astype('datetime64[h]').astype('int64') % 24).astype('int8')
+
+        # city_pop ya quedo validado como entero positivo
+        if 'city_pop' in self.df_limpio.columns:
+            self.df_limpio['city_pop'] = self.df_limpio['city_pop'].astype('uint32')
              
         self.reporte['columnas_agregadas'] = self.COLUMNAS_TEMPORALES.copy()
         
@@ -615,12 +800,20 @@ class LimpiadorDatos:
     
     def obtener_dataframe_limpio(self) -> pd.DataFrame:
         """
-        Retorna el DataFrame limpio.
-        
+        Retorna el DataFrame limpio y cede su propiedad al llamador.
+
+        No se devuelve una copia: el limpiador suelta su referencia
+        interna para no mantener vivo un segundo frame de millones de
+        filas. Debe ser la última llamada sobre la instancia.
+
         Returns:
             DataFrame procesado
         """
-        return self.df_limpio.copy()
+        if self._valid is not None:
+            self._materializar_filtros()
+        df = self.df_limpio
+        self.df_limpio = None
+        return df
     
     def generar_reporte(self) -> Dict:
         """
@@ -629,6 +822,8 @@ class LimpiadorDatos:
         Returns:
             Diccionario con estadísticas
         """
+        if self._valid is not None:
+            self._materializar_filtros()
         self.reporte['filas_finales'] = len(self.df_limpio)
         self.reporte['columnas_finales'] = len(self.df_limpio.columns)
         return self.reporte
@@ -670,31 +865,46 @@ class LimpiadorDatos:
     
     def guardar_dataset_limpio(self, ruta: str) -> None:
         """
-        Guarda el dataset limpio en un archivo CSV y Parquet.
-        
+        Guarda el dataset limpio en Parquet y, si se pide, en CSV.
+
         Args:
-            ruta: Ruta base donde guardar el archivo (se usará para CSV)
+            ruta: Ruta base donde guardar el archivo (.parquet o .csv)
         """
-        # Guardar CSV
         Path(ruta).parent.mkdir(parents=True, exist_ok=True)
-        self.df_limpio.to_csv(ruta, index=False, encoding='utf-8')
-        print(f"\nDataset limpio guardado en CSV: {ruta}")
-        
-        # Guardar Parquet (mismo nombre base, extensión .parquet)
+
+        # Parquet es el formato principal: conserva los dtypes (las
+        # categóricas viajan como columnas diccionario) y comprime por
+        # columnas, así la siguiente etapa no re-parsea fechas ni texto
         ruta_parquet = str(Path(ruta).with_suffix('.parquet'))
-        self.df_limpio.to_parquet(ruta_parquet, index=False)
-        print(f"Dataset limpio guardado en Parquet: {ruta_parquet}")
+        self.df_limpio.to_parquet(ruta_parquet, engine='pyarrow', compression='zstd', index=False)
+        print(f"\nDataset limpio guardado en Parquet: {ruta_parquet}")
+
+        # CSV solo cuando la ruta lo pide explícitamente (el workflow de
+        # CI sigue publicando esta copia como artefacto)
+        if ruta.endswith('.csv'):
+            self.df_limpio.to_csv(ruta, index=False, encoding='utf-8')
+            print(f"Dataset limpio guardado en CSV: {ruta}")
+        
+        # Guardar además una copia particionada por año (estilo Hive):
+        # un lector que filtre por años abre solo los archivos de los
+        # años pedidos en lugar de todo el dataset
+        ruta_particionada = Path(ruta).with_suffix('').as_posix() + '_anio'
+        if Path(ruta_particionada).exists():
+            shutil.rmtree(ruta_particionada)
+        self.df_limpio.to_parquet(ruta_particionada, index=False, compression='zstd', partition_cols=['anio'])
+        print(f"Dataset particionado por anio guardado en: {ruta_particionada}")
         
         print(f"   - {len(self.df_limpio):,} filas x {len(self.df_limpio.columns)} columnas")
 
 
-def limpiar_dataset(df: pd.DataFrame, guardar_en: str = None) -> pd.DataFrame:
+def limpiar_dataset(df: pd.DataFrame, guardar_en: str = None, verbose: bool = False) -> pd.DataFrame:
     """
     Función principal para limpiar el dataset.
     
     Args:
         df: DataFrame original
         guardar_en: Ruta donde guardar el dataset limpio (opcional)
+        verbose: Si True, imprime diagnósticos extra de transformación
     
     Returns:
         DataFrame limpio y enriquecido
@@ -710,7 +920,7 @@ def limpiar_dataset(df: pd.DataFrame, guardar_en: str = None) -> pd.DataFrame:
     print("   - Derivadas: state_name, anio, mes, dia, hora")
     
     # Crear instancia del limpiador
-    limpiador = LimpiadorDatos(df)
+    limpiador = LimpiadorDatos(df, verbose=verbose)
     
     # Ejecutar pipeline de limpieza
     limpiador \
@@ -738,6 +948,97 @@ def limpiar_dataset(df: pd.DataFrame, guardar_en: str = None) -> pd.DataFrame:
     return limpiador.obtener_dataframe_limpio()
 
 
+def limpiar_dataset_chunked(csv_path: str, guardar_en: str,
+                            chunksize: int = 500_000, verbose: bool = False) -> int:
+    """
+    Limpia el dataset por trozos para acotar el pico de memoria.
+
+    Lee el CSV con chunksize, limpia cada trozo con LimpiadorDatos y lo
+    anexa a un único Parquet mediante ParquetWriter, de modo que en
+    memoria nunca vive más de un trozo. Los trans_num repetidos entre
+    trozos se descartan con un conjunto de hashes uint64.
+
+    Args:
+        csv_path: Ruta del CSV de entrada
+        guardar_en: Ruta del Parquet de salida
+        chunksize: Filas por trozo
+        verbose: Se propaga a LimpiadorDatos
+
+    Returns:
+        Número total de filas limpias escritas
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    ruta_parquet = Path(guardar_en).with_suffix('.parquet')
+    ruta_parquet.parent.mkdir(parents=True, exist_ok=True)
+
+    # usecols acota la lectura a lo que el limpiador va a conservar
+    columnas_archivo = pd.read_csv(csv_path, nrows=0).columns
+    columnas_leer = [col for col in LimpiadorDatos.COLUMNAS_NECESARIAS
+                     if col in columnas_archivo]
+    # Solo declarar dtypes de columnas presentes, por si el esquema
+    # del archivo difiere del de Kaggle
+    dtypes_leer = {col: tipo for col, tipo in KAGGLE_DTYPES.items()
+                   if col in columnas_leer}
+
+    print("\n" + "=" * 70)
+    print("LIMPIEZA DE DATOS POR TROZOS - PROYECTO INTEGRADOR 5")
+    print("=" * 70)
+    print(f"   - Trozo: {chunksize:,} filas")
+
+    # Acumulado ordenado de hashes ya escritos: permite filtrar cada
+    # trozo con búsqueda binaria vectorizada en vez de un bucle Python
+    hashes_vistos = np.empty(0, dtype=np.uint64)
+    escritor = None
+    total_filas = 0
+
+    try:
+        for numero, trozo in enumerate(
+                pd.read_csv(csv_path, usecols=columnas_leer, dtype=dtypes_leer,
+                            chunksize=chunksize, memory_map=True), start=1):
+            print(f"\n--- Trozo {numero} ({len(trozo):,} filas) ---")
+            df_trozo = limpiar_dataset(trozo, verbose=verbose)
+
+            # Un trozo que queda vacío tras la limpieza no aporta filas
+            # y sus tipos inferidos sobre cero filas pueden no coincidir
+            # con el esquema que ParquetWriter congeló del primer trozo
+            if df_trozo.empty:
+                continue
+
+            # Deduplicar entre trozos: eliminar_duplicados solo ve su
+            # trozo (y ya quitó los repetidos internos), así que los IDs
+            # escritos en trozos anteriores se filtran aquí con
+            # searchsorted sobre el acumulado ordenado
+            hashes = pd.util.hash_array(df_trozo['trans_num'].to_numpy())
+            if hashes_vistos.size:
+                posiciones = np.minimum(
+                    np.searchsorted(hashes_vistos, hashes),
+                    hashes_vistos.size - 1
+                )
+                nuevos = hashes_vistos[posiciones] != hashes
+            else:
+                nuevos = np.ones(len(hashes), dtype=bool)
+            if not nuevos.all():
+                print(f"   - Duplicados entre trozos descartados: {int((~nuevos).sum()):,}")
+                df_trozo = df_trozo[nuevos]
+                hashes = hashes[nuevos]
+            hashes_vistos = np.union1d(hashes_vistos, hashes)
+
+            tabla = pa.Table.from_pandas(df_trozo, preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(ruta_parquet, tabla.schema, compression='zstd')
+            escritor.write_table(tabla)
+            total_filas += len(df_trozo)
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+    print(f"\nDataset limpio guardado en Parquet: {ruta_parquet}")
+    print(f"   - {total_filas:,} filas escritas")
+    return total_filas
+
+
 def main():
     """
     Función principal para ejecutar desde línea de comandos.
@@ -769,10 +1070,15 @@ def main():
         print("   - 'csv/export.csv' no encontrado. Buscando en cache de Kaggle...")
         kaggle_cache = Path.home() / '.cache' / 'kagglehub' / 'datasets' / 'priyamchoksi' / 'credit-card-transactions-dataset' / 'versions' / '1'
         
-        if kaggle_cache.exists() and kaggle_cache.is_dir():
-            archivos_csv = list(kaggle_cache.glob('*.csv'))
-            if archivos_csv:
-                csv_file = archivos_csv[0]
+        if kaggle_cache.is_dir():
+            # scandir itera perezosamente y se corta en el primer CSV,
+            # sin listar ni stat()-ear el resto del directorio como glob
+            csv_file = next(
+                (Path(entrada.path) for entrada in os.scandir(kaggle_cache)
+                 if entrada.name.endswith('.csv')),
+                None
+            )
+            if csv_file is not None:
                 print(f"   - Archivo encontrado (Kaggle cache): {csv_file}")
     
     if csv_file is None:
@@ -783,10 +1089,36 @@ def main():
     
 
     
+    # Si la salida ya es más nueva que el CSV de entrada no hay nada
+    # que recalcular: se omiten el parseo y la limpieza completos
+    ruta_salida = project_root / 'data' / 'dataset_enriquecido.csv'
+    ruta_parquet = ruta_salida.with_suffix('.parquet')
+    if (ruta_salida.exists() and ruta_parquet.exists()
+            and ruta_parquet.stat().st_mtime > csv_file.stat().st_mtime):
+        print(f"\nSalida vigente encontrada: {ruta_parquet}")
+        print("   - Es mas reciente que el CSV de entrada; se omite la limpieza")
+        return 0
+    
     # Cargar el dataset
     print(f"\nCargando dataset...")
     try:
-        df_original = pd.read_csv(csv_file, low_memory=False)
+        # Lector multihilo de Arrow si está disponible (el parser en C
+        # de pandas es monohilo); self_destruct libera los buffers de
+        # Arrow conforme se convierten a pandas
+        try:
+            import pyarrow.csv as pacsv
+            df_original = pacsv.read_csv(
+                str(csv_file),
+                read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20)
+            ).to_pandas(self_destruct=True, split_blocks=True)
+        except ImportError:
+            try:
+                df_original = pd.read_csv(csv_file, dtype=KAGGLE_DTYPES,
+                                          memory_map=True)
+            except ValueError:
+                # El esquema difiere del declarado: volver a la
+                # inferencia por defecto
+                df_original = pd.read_csv(csv_file, memory_map=True)
         print(f"   - Dataset cargado:")
         print(f"      Filas: {len(df_original):,}")
         print(f"      Columnas: {len(df_original.columns)}")
@@ -797,7 +1129,6 @@ def main():
     # Ejecutar limpieza
     print(f"\nEjecutando limpieza...")
     try:
-        ruta_salida = project_root / 'data' / 'dataset_enriquecido.csv'
         df_limpio = limpiar_dataset(
             df=df_original,
             guardar_en=str(ruta_salida)
@@ -13,30 +13,195 @@ import sqlite3
 import sys
 from pathlib import Path
 
-# Añadir el directorio raíz al path para importar Ingestar
+import numpy as np
+import pandas as pd
+
+# sqlite3 solo sabe enlazar tipos nativos de Python; los enteros de
+# numpy que salen de itertuples necesitan adaptador explícito
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+sqlite3.register_adapter(np.int16, int)
+sqlite3.register_adapter(np.int8, int)
+sqlite3.register_adapter(np.float32, float)
+
+# Esquema conocido del dataset de Kaggle: declarar los dtypes evita la
+# doble pasada de inferencia del parser y codifica en category/float32
+# las columnas donde alcanza, con la mitad de RAM que la inferencia
+KAGGLE_DTYPES = {
+    'cc_num': 'int64',
+    'merchant': 'category',
+    'category': 'category',
+    'amt': 'float32',
+    'gender': 'category',
+    'city': 'category',
+    'state': 'category',
+    'zip': 'int32',
+    'lat': 'float32',
+    'long': 'float32',
+    'city_pop': 'int64',
+    'job': 'category',
+    'unix_time': 'int64',
+    'merch_lat': 'float32',
+    'merch_long': 'float32',
+    'is_fraud': 'int8',
+}
+
+# Raíz del proyecto, solo para resolver rutas de datos
 project_root = Path(__file__).parent.parent.parent
-sys.path.insert(0, str(project_root))
 
-from src.proyecto_integrador.ingestar import Ingestar
+try:
+    # Import relativo: resuelve en la caché de imports sin volver a
+    # recorrer sys.path
+    from .ingestar import Ingestar
+except ImportError:
+    # Ejecutado como script (python src/.../load_to_sqlite.py) no hay
+    # paquete padre, así que se recurre al sys.path de siempre
+    sys.path.insert(0, str(project_root))
+    from src.proyecto_integrador.ingestar import Ingestar
+
+
+def _dtypes_para(path) -> dict:
+    """
+    Filtra KAGGLE_DTYPES a las columnas presentes en el archivo.
+
+    Solo lee el encabezado; si el esquema del archivo se ha desviado
+    del de Kaggle, las columnas desconocidas quedan en inferencia por
+    defecto.
+    """
+    columnas = pd.read_csv(path, nrows=0).columns
+    return {col: tipo for col, tipo in KAGGLE_DTYPES.items() if col in columnas}
+
+
+def _leer_csv(path):
+    """Lee un CSV completo declarando el esquema conocido de Kaggle."""
+    try:
+        return pd.read_csv(path, dtype=_dtypes_para(path), memory_map=True)
+    except ValueError:
+        # Valores fuera del tipo declarado: volver a la inferencia
+        return pd.read_csv(path, memory_map=True)
+
 
+def _iterar_trozos_csv(path, chunksize: int = 200_000):
+    """
+    Itera un CSV en DataFrames acotados.
 
-def insertar_datos(conn, df):
+    Con pyarrow disponible usa su lector de streaming multihilo
+    (lotes de ~8 MB); en su defecto cae al chunksize de pandas.
+    """
+    try:
+        import pyarrow.csv as pacsv
+    except ImportError:
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=_dtypes_para(path))
+        return
+    lector = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20)
+    )
+    for lote in lector:
+        yield lote.to_pandas()
+
+
+def _tipo_sqlite(dtype) -> str:
+    """Mapea un dtype de pandas al tipo de columna SQLite."""
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def insertar_datos(conn, df, chunksize: int = 50_000, reemplazar: bool = True):
     """
     Inserta los datos del DataFrame en la tabla de transacciones.
-    
+
+    La tabla se crea con DDL explícito y los registros entran por
+    executemany, con PRAGMAs de carga masiva (sin fsync por inserción y
+    diario en memoria). Con reemplazar=False los registros se anexan a
+    la tabla existente, lo que permite cargar por trozos sin
+    reconstruirla.
+
     Args:
         conn: Conexión a la base de datos SQLite
         df: DataFrame con los datos a insertar
+        chunksize: Filas por lote de executemany
+        reemplazar: Si True, recrea la tabla antes de insertar
+    """
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+    if reemplazar:
+        columnas = ', '.join(f'"{col}" {_tipo_sqlite(tipo)}' for col, tipo in df.dtypes.items())
+        conn.execute('DROP TABLE IF EXISTS transacciones')
+        conn.execute(f'CREATE TABLE transacciones ({columnas})')
+
+    sql = f"INSERT INTO transacciones VALUES ({', '.join('?' * len(df.columns))})"
+    cursor = conn.cursor()
+    # executemany compila la sentencia una vez y re-enlaza en C, el
+    # equivalente práctico del method='multi' de to_sql pero sin el
+    # límite de ~32k parámetros por sentencia; el with agrupa todos los
+    # lotes (y el DDL previo) en una única transacción
+    with conn:
+        try:
+            import pyarrow as pa
+        except ImportError:
+            pa = None
+        if pa is not None:
+            # Los lotes de Arrow entregan valores nativos de Python
+            # (str/int/float/None) leidos de buffers contiguos; NaN sale
+            # como NULL y no hay que desempaquetar escalares de numpy
+            # fila a fila como hace itertuples
+            tabla = pa.Table.from_pandas(df, preserve_index=False)
+            for lote in tabla.to_batches(max_chunksize=chunksize):
+                filas = zip(*(columna.to_pylist() for columna in lote.columns))
+                cursor.executemany(sql, filas)
+        else:
+            for inicio in range(0, len(df), chunksize):
+                trozo = df.iloc[inicio:inicio + chunksize]
+                cursor.executemany(sql, trozo.itertuples(index=False, name=None))
+
+
+def crear_indices(conn):
+    """
+    Crea índices sobre las columnas de filtrado habituales.
+
+    Cuesta unos segundos al cargar, pero cualquier consulta posterior
+    con WHERE sobre estas columnas pasa de un escaneo completo de la
+    tabla a un rango de índice.
+
+    Args:
+        conn: Conexión a la base de datos SQLite
     """
-    # Insertar datos usando pandas
-    df.to_sql('transacciones', conn, if_exists='replace', index=False)
-    print(f" {len(df):,} registros insertados en la base de datos")
+    indices = {
+        'ix_tx_fecha': 'trans_date_trans_time',
+        'ix_tx_gender': 'gender',
+        'ix_tx_state': 'state',
+        'ix_tx_category': 'category',
+    }
+    # La tabla se crea a partir del CSV que toque, así que solo se
+    # indexan las columnas que existan de verdad
+    columnas = {fila[1] for fila in conn.execute('PRAGMA table_info(transacciones)')}
+    creados = []
+    for nombre, columna in indices.items():
+        if columna in columnas:
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS {nombre} ON transacciones("{columna}")'
+            )
+            creados.append(columna)
+    conn.execute('ANALYZE')
+    if creados:
+        print(f" Índices creados sobre: {', '.join(creados)}")
 
 
 def cargar_desde_directorio(data_dir, db_path):
     """
     Carga datos desde un directorio con archivos CSV a SQLite.
-    
+
+    Los archivos se consumen como un pipeline de trozos que va directo
+    al escritor de SQLite: el DataFrame combinado no se materializa
+    nunca (no hay pd.concat), así que el pico de memoria es un solo
+    trozo o, con varios archivos, un archivo por proceso lector.
+
     Args:
         data_dir: Directorio con los archivos CSV
         db_path: Ruta a la base de datos SQLite
@@ -44,39 +209,105 @@ def cargar_desde_directorio(data_dir, db_path):
     Returns:
         Número de registros insertados
     """
-    import pandas as pd
-    import os
-    
     # Buscar archivos CSV
     csv_files = [f for f in os.listdir(data_dir) if f.endswith('.csv')]
     if not csv_files:
         raise FileNotFoundError(f'No se encontraron archivos CSV en {data_dir}')
     
-    # Leer y concatenar todos los CSV
-    dfs = []
-    for csv_file in csv_files:
-        path = os.path.join(data_dir, csv_file)
-        print(f'Leyendo {path}...')
-        df_tmp = pd.read_csv(path, low_memory=False)
-        dfs.append(df_tmp)
-    
-    df_all = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
-    
-    if df_all.empty:
+    # Leer por trozos e insertar directamente: nunca se materializa el
+    # dataset concatenado, así que el pico de memoria es un solo trozo
+    conn = sqlite3.connect(db_path, timeout=60)
+    total = 0
+    primer_trozo = True
+    if len(csv_files) > 1:
+        # Varios archivos: el parser de pandas es monohilo por llamada,
+        # así que cada CSV se parsea en su propio proceso y las
+        # escrituras a SQLite se quedan en el hilo principal para no
+        # pelear por el lock de la base
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(max_workers=min(len(csv_files), os.cpu_count() or 1)) as pool:
+            futuros = {
+                pool.submit(_leer_csv, os.path.join(data_dir, f)): f
+                for f in csv_files
+            }
+            for futuro in as_completed(futuros):
+                print(f'Leyendo {os.path.join(data_dir, futuros[futuro])}...')
+                df_archivo = futuro.result()
+                insertar_datos(conn, df_archivo, reemplazar=primer_trozo)
+                primer_trozo = False
+                total += len(df_archivo)
+                print(f'   {total:,} registros insertados...')
+    else:
+        # El progreso se reporta como mucho una vez por millón de
+        # filas: un print por trozo domina la E/S de terminal cuando
+        # los trozos son pequeños
+        ultimo_reporte = 0
+        for csv_file in csv_files:
+            path = os.path.join(data_dir, csv_file)
+            print(f'Leyendo {path}...')
+            for trozo in _iterar_trozos_csv(path):
+                insertar_datos(conn, trozo, reemplazar=primer_trozo)
+                primer_trozo = False
+                total += len(trozo)
+                if total - ultimo_reporte >= 1_000_000:
+                    print(f'   {total:,} registros insertados...')
+                    ultimo_reporte = total
+
+    if total == 0:
         print('No hay datos para cargar.')
+        conn.close()
         return 0
-    
-    # Conectar y cargar
-    conn = sqlite3.connect(db_path, timeout=60)
-    insertar_datos(conn, df_all)
+
+    print(f" {total:,} registros insertados en la base de datos")
+    crear_indices(conn)
     conn.close()
     
-    return len(df_all)
+    return total
+
+
+def cargar_desde_directorio_duckdb(data_dir, db_path):
+    """
+    Variante DuckDB de la carga: una sola sentencia vectorizada.
+
+    DuckDB parsea los CSV con su propio lector multihilo y crea la
+    tabla sin pasar por el enlace fila a fila de Python; el archivo
+    .duckdb resultante se consulta con SQL igual que el .db de SQLite.
+    Es el equivalente de una carga estilo COPY: pasar por un archivo
+    Arrow IPC intermedio solo añadiría materializar el DataFrame
+    completo en pandas y una escritura extra a disco.
+
+    Args:
+        data_dir: Directorio con los archivos CSV
+        db_path: Ruta base de la base de datos (se usa con sufijo .duckdb)
+
+    Returns:
+        Número de registros insertados
+    """
+    import duckdb
+
+    csv_files = [f for f in os.listdir(data_dir) if f.endswith('.csv')]
+    if not csv_files:
+        raise FileNotFoundError(f'No se encontraron archivos CSV en {data_dir}')
+
+    ruta_duckdb = str(Path(db_path).with_suffix('.duckdb'))
+    con = duckdb.connect(ruta_duckdb)
+    con.execute(
+        "CREATE OR REPLACE TABLE transacciones AS SELECT * FROM read_csv_auto(?)",
+        [os.path.join(data_dir, '*.csv')]
+    )
+    total = con.execute("SELECT COUNT(*) FROM transacciones").fetchone()[0]
+    con.close()
+
+    print(f" {total:,} registros insertados en {ruta_duckdb}")
+    return total
 
 
 def main():
     """
     Función principal - ejecuta el proceso completo desde cero.
+
+    Acepta --engine=duckdb para cargar a DuckDB en vez de SQLite.
     """
     print("=" * 60)
     print("CARGA DE DATOS A SQLITE")
@@ -101,9 +332,13 @@ def main():
         print("\n Procesando archivos descargados...")
         data_dir = ingestar.extract_zip_files(dataset_path)
         
-        # Cargar a SQLite
-        print(f"\n Cargando datos a {db_path}...")
-        count = cargar_desde_directorio(data_dir, db_path)
+        # Cargar a SQLite (o a DuckDB si se pidió ese motor)
+        if '--engine=duckdb' in sys.argv[1:]:
+            print(f"\n Cargando datos a {Path(db_path).with_suffix('.duckdb')}...")
+            count = cargar_desde_directorio_duckdb(data_dir, db_path)
+        else:
+            print(f"\n Cargando datos a {db_path}...")
+            count = cargar_desde_directorio(data_dir, db_path)
         
         print("\n" + "=" * 60)
         print(" PROCESO COMPLETADO EXITOSAMENTE")